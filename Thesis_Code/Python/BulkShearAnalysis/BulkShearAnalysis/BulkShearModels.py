@@ -0,0 +1,165 @@
+#Frequency dependence models for the bulk/shear decomposition, used by the Models mode of
+#PhiBulkShearDecomp.py. Instead of commenting lines in and out to switch between "no scaling"
+#and "linear scaling" of Phi_bu, every combination of the forms below is fit for bulk and
+#shear and the combinations are ranked.
+#
+#   constant - Phi(f) = A
+#   linear   - Phi(f) = A*(f/f_ref)
+#   power    - Phi(f) = A*(f/f_ref)^alpha
+#   peak     - Phi(f) = 2*A*(f/f0)/(1 + (f/f0)^2), a Debye loss peak of height A at f0
+#
+#with f_ref = 1 kHz. The full model is Phi_tot = D_bu*Phi_bu(f) + D_sh*Phi_sh(f), so the
+#amplitudes always enter linearly. Each fit grids over the nonlinear parameters (alpha, f0),
+#solves the amplitudes exactly at every grid point in one batched solve (BulkShearTools), then
+#polishes the best grid point with curve_fit to get the covariance.
+#
+#Models are compared with
+#   AIC = chi^2 + 2k        BIC = chi^2 + k*ln(n)
+#for k parameters and n modes, lower is better. Differences of a few units are meaningful,
+#differences below ~2 are not. All (temperature, model) fits are spread over a process pool.
+
+import multiprocessing
+import numpy as np
+from scipy.optimize import curve_fit
+import BulkShearTools
+
+f_ref = 1000. #Hz
+
+def _constant(f, A):
+    return A*np.ones(np.shape(f))
+
+def _linear(f, A):
+    return A*(f/f_ref)
+
+def _power(f, A, alpha):
+    return A*(f/f_ref)**alpha
+
+def _peak(f, A, f0):
+    return 2*A*(f/f0)/(1 + (f/f0)**2)
+
+#name: (function, grid of nonlinear parameter values or None, parameter names)
+freq_forms = {
+    'constant': (_constant, None, ['A']),
+    'linear': (_linear, None, ['A']),
+    'power': (_power, np.linspace(-2, 2, 41), ['A', 'alpha']),
+    'peak': (_peak, np.logspace(1.5, 5, 36), ['A', 'f0']),
+}
+form_names = ['constant', 'linear', 'power', 'peak']
+
+
+class FrequencyModel(object):
+    #Phi_tot = D_bu*bulk(f) + D_sh*shear(f). X has columns Freq, D_bu, D_sh. Parameters are
+    #the bulk ones then the shear ones, amplitude first. Has the fit/predict/n_params
+    #interface BulkShearTools.bootstrap_pool uses.
+    def __init__(self, bulk, shear):
+        self.bulk = bulk
+        self.shear = shear
+        self.n_bulk = len(freq_forms[bulk][2])
+        self.n_params = self.n_bulk + len(freq_forms[shear][2])
+        self.name = bulk + '/' + shear
+        self.param_names = ['bulk_' + p for p in freq_forms[bulk][2]] + ['shear_' + p for p in freq_forms[shear][2]]
+
+    def predict(self, X, params):
+        X = np.asarray(X, dtype=float)
+        f, D_bu, D_sh = X[:, 0], X[:, 1], X[:, 2]
+        return D_bu*freq_forms[self.bulk][0](f, *params[:self.n_bulk]) + D_sh*freq_forms[self.shear][0](f, *params[self.n_bulk:])
+
+    def _grid(self):
+        #Every combination of nonlinear parameter values, as (points, 2) with NaN for unused
+        bulk_grid = freq_forms[self.bulk][1]
+        shear_grid = freq_forms[self.shear][1]
+        bulk_grid = bulk_grid if bulk_grid is not None else np.array([np.nan])
+        shear_grid = shear_grid if shear_grid is not None else np.array([np.nan])
+        b, s = np.meshgrid(bulk_grid, shear_grid, indexing='ij')
+        return np.column_stack([b.ravel(), s.ravel()])
+
+    def _params(self, amplitudes, nonlinear):
+        params = [amplitudes[0]]
+        if self.n_bulk > 1:
+            params.append(nonlinear[0])
+        params.append(amplitudes[1])
+        if self.n_params - self.n_bulk > 1:
+            params.append(nonlinear[1])
+        return np.array(params)
+
+    def fit(self, X, y, sigma):
+        return self.fit_full(X, y, sigma)[0]
+
+    def fit_full(self, X, y, sigma):
+        #Returns popt, perr and chi^2
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        sigma = np.asarray(sigma, dtype=float)
+        f, D_bu, D_sh = X[:, 0], X[:, 1], X[:, 2]
+        grid = self._grid()
+        #Amplitude columns at every grid point, shape (grid, points, 2)
+        A = np.empty((len(grid), len(y), 2))
+        for k in range(len(grid)):
+            unit = self._params([1., 1.], grid[k])
+            A[k, :, 0] = D_bu*freq_forms[self.bulk][0](f, *unit[:self.n_bulk])
+            A[k, :, 1] = D_sh*freq_forms[self.shear][0](f, *unit[self.n_bulk:])
+        amplitudes, pcov, residuals, chi2, dof = BulkShearTools.batched_lstsq(A, np.tile(y, (len(grid), 1)), np.tile(sigma, (len(grid), 1)), absolute_sigma=True)
+        best = np.nanargmin(chi2)
+        popt = self._params(amplitudes[best], grid[best])
+        perr = np.full(self.n_params, np.nan)
+        if self.n_params == 2:
+            perr = np.sqrt(np.diag(pcov[best]))
+        else:
+            try:
+                model = lambda I, *params: self.predict(I.T, params)
+                popt_cf, pcov_cf = curve_fit(model, X.T, y, p0=popt, sigma=sigma, absolute_sigma=True, maxfev=5000)
+                chi2_cf = np.sum(((y - self.predict(X, popt_cf))/sigma)**2)
+                if chi2_cf <= chi2[best]:
+                    popt = popt_cf
+                    perr = np.sqrt(np.diag(pcov_cf))
+            except (RuntimeError, ValueError):
+                pass
+        chi2_best = float(np.sum(((y - self.predict(X, popt))/sigma)**2))
+        return popt, perr, chi2_best
+
+def all_models():
+    return [FrequencyModel(bulk, shear) for bulk in form_names for shear in form_names]
+
+def _fit_job(job):
+    #Worker: one model at one temperature
+    bulk, shear, X, y, sigma = job
+    model = FrequencyModel(bulk, shear)
+    used = np.isfinite(y) & np.isfinite(sigma) & np.all(np.isfinite(X), axis=1)
+    n = int(np.sum(used))
+    if n <= model.n_params:
+        return model.name, model.param_names, np.full(model.n_params, np.nan), np.full(model.n_params, np.nan), np.nan, n
+    popt, perr, chi2 = model.fit_full(X[used], y[used], sigma[used])
+    return model.name, model.param_names, popt, perr, chi2, n
+
+def compare_models(Freq, D_bu, D_sh, Phi_tot, Std_tot, criterion='AIC', processes=None):
+    #Freq, Phi_tot, Std_tot are (temperatures, modes), D_bu, D_sh broadcast against them.
+    #Returns a list over temperatures of result lists sorted by criterion (AIC or BIC), best
+    #first. Each result is a dictionary with name (bulk form/shear form), param_names, popt,
+    #perr, chi2, n, k, AIC and BIC
+    if criterion not in ('AIC', 'BIC'):
+        raise ValueError('criterion must be AIC or BIC, got ' + str(criterion))
+    Freq = np.asarray(Freq, dtype=float)
+    D_bu = np.asarray(D_bu, dtype=float)*np.ones(Freq.shape)
+    D_sh = np.asarray(D_sh, dtype=float)*np.ones(Freq.shape)
+    jobs = []
+    for t in range(Freq.shape[0]):
+        X = np.column_stack([Freq[t], D_bu[t], D_sh[t]])
+        for model in all_models():
+            jobs.append((model.bulk, model.shear, X, Phi_tot[t], Std_tot[t]))
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_fit_job, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    n_models = len(form_names)**2
+    ranked = []
+    for t in range(Freq.shape[0]):
+        rows = []
+        for name, param_names, popt, perr, chi2, n in results[t*n_models:(t + 1)*n_models]:
+            k = len(param_names)
+            rows.append({'name': name, 'param_names': param_names, 'popt': popt, 'perr': perr, 'chi2': chi2, 'n': n, 'k': k,
+                         'AIC': chi2 + 2*k, 'BIC': chi2 + k*np.log(n) if n > 0 else np.nan})
+        rows.sort(key=lambda row: row[criterion] if np.isfinite(row[criterion]) else np.inf)
+        ranked.append(rows)
+    return ranked
@@ -0,0 +1,331 @@
+#Fitting tools for PhiBulkShearDecomp.py.
+#
+#The decomposition Phi_tot = D_bu*Phi_bu + D_sh*Phi_sh is linear in Phi_bu and Phi_sh, so the
+#best fit can be written down directly instead of searched for with curve_fit. Dividing every
+#row by its standard deviation turns the sigma weighted fit into an ordinary least squares
+#problem A_w*p = y_w, which numpy solves exactly (see the least-squares page referenced in
+#PhiBulkShearDecomp, the same chi^2 is being minimized). The covariance is (A_w^T A_w)^-1.
+#Like curve_fit, by default it is scaled by the reduced chi^2 so the errors reflect the scatter
+#of the data. Pass absolute_sigma=True to take the standard deviations at face value.
+#
+#With nonneg=True the fit is restricted to Phi_bu, Phi_sh >= 0 using scipy's NNLS. Parameters
+#that end up pinned at 0 get 0 error, the covariance of the rest comes from their columns only.
+#
+#For the all-temperature run, load_temperature_stack reads every "<T>K_ModeFreqVsPhi.txt" file
+#into (temperature, mode) arrays and batched_lstsq solves every temperature's fit at once from
+#the stacked normal equations. Missing points (NaN, e.g. a file with fewer modes) are left out
+#of that temperature's fit.
+#
+#TE correction: the full model is Phi_tot = D_sh*Phi_sh + D_bu*(Phi_bu + Phi_TE). TELossCache
+#gives Phi_TE (the sum of the chosen TEModel components) at the measured (temperature, mode
+#frequency) points, and te_corrected subtracts D_bu*Phi_TE from the data so the same linear fit
+#applies. Points where the model can't be evaluated (outside its temperature tables, or a mode
+#outside the substrate dilution table when phi_sub is included) come back NaN and drop out of
+#the fit.
+
+import os
+import re
+import sys
+import glob
+import multiprocessing
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', '..', 'SharedTools', 'SharedTools'))
+sys.path.append(os.path.join(here, '..', '..', 'Thermoelastic Modeling', 'Thermoelastic Modeling'))
+import ColumnLoader
+import TEModel
+
+try:
+    from scipy.optimize import nnls
+except ImportError:
+    nnls = None
+
+def design_matrix(Freq, D_bu, D_sh, bulk_linear_in_freq=False):
+    #Columns multiply Phi_bu and Phi_sh. bulk_linear_in_freq=True is the Phi_bu*Freq model.
+    #Freq can be (modes,) or (temperatures, modes), the last axis of the result is the parameter
+    Freq = np.asarray(Freq, dtype=float)
+    bulk = np.asarray(D_bu, dtype=float)*np.ones(Freq.shape)
+    if bulk_linear_in_freq:
+        bulk = bulk*Freq
+    return np.stack([bulk, np.asarray(D_sh, dtype=float)*np.ones(Freq.shape)], axis=-1)
+
+def weighted_lstsq(A, y, sigma, absolute_sigma=False, nonneg=False):
+    #Returns popt, pcov, residuals (y - A*popt), chi^2 and the degrees of freedom (points
+    #minus the parameters actually fit, a parameter the non-negative fit pins at 0 doesn't count)
+    A = np.asarray(A, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    if np.any(sigma <= 0):
+        raise ValueError('Every standard deviation has to be positive to weight the fit')
+    A_w = A/sigma[:, np.newaxis]
+    y_w = y/sigma
+    n, n_params = A.shape
+    if nonneg:
+        if nnls is None:
+            raise ImportError('scipy is needed for the non-negative fit')
+        popt = nnls(A_w, y_w)[0]
+        free = popt > 0
+    else:
+        popt = np.linalg.lstsq(A_w, y_w, rcond=None)[0]
+        free = np.ones(n_params, dtype=bool)
+    residuals = y - A.dot(popt)
+    chi2 = float(np.sum((residuals/sigma)**2))
+
+    pcov = np.zeros((n_params, n_params))
+    if np.any(free):
+        A_free = A_w[:, free]
+        pcov[np.ix_(free, free)] = np.linalg.pinv(A_free.T.dot(A_free))
+    dof = int(n - np.sum(free))
+    if not absolute_sigma:
+        pcov = pcov*(chi2/dof) if dof > 0 else np.full((n_params, n_params), np.inf)
+    return popt, pcov, residuals, chi2, dof
+
+temperature_pattern = re.compile(r'([0-9.]+)K_ModeFreqVsPhi\.txt$')
+
+def load_temperature_stack(directory):
+    #Returns T (temperatures,) and Freq, Phi_tot, Std_tot (temperatures, modes), sorted by T.
+    #Files with fewer modes are padded with NaN.
+    found = []
+    for filename in glob.glob(os.path.join(directory, '*K_ModeFreqVsPhi.txt')):
+        match = temperature_pattern.search(os.path.basename(filename))
+        if match is not None:
+            found.append((float(match.group(1)), filename))
+    if len(found) == 0:
+        raise IOError('No <T>K_ModeFreqVsPhi.txt files found in ' + directory)
+    found.sort()
+    tables = [ColumnLoader.load_table(filename)[:, :3] for T, filename in found]
+    n_modes = max(len(table) for table in tables)
+    stack = np.full((len(tables), n_modes, 3), np.nan)
+    for k, table in enumerate(tables):
+        stack[k, :len(table)] = table
+    T = np.array([T for T, filename in found])
+    return T, stack[:, :, 0], stack[:, :, 1], stack[:, :, 2]
+
+def batched_lstsq(A, y, sigma, absolute_sigma=False, nonneg=False):
+    #weighted_lstsq for many data sets at once. A is (sets, points, params), y and sigma are
+    #(sets, points). Returns popt (sets, params), pcov (sets, params, params), residuals
+    #(sets, points), chi^2 (sets,) and the degrees of freedom (sets,). NNLS has no closed
+    #form, so nonneg=True fits the sets one after another. A set with fewer usable points than
+    #parameters (e.g. all NaN after the TE subtraction) or a singular design can't be fit, its
+    #popt, pcov, residuals and chi^2 come back NaN instead of made up zeros.
+    A = np.asarray(A, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    used = np.isfinite(y) & np.isfinite(sigma) & np.all(np.isfinite(A), axis=-1)
+    if np.any(sigma[used] <= 0):
+        raise ValueError('Every standard deviation has to be positive to weight the fit')
+    if nonneg:
+        return _nonneg_sets(A, y, sigma, used, absolute_sigma)
+    w = np.where(used, 1/np.where(used, sigma, 1.), 0.)
+    A_w = np.where(used[..., np.newaxis], A, 0.)*w[..., np.newaxis]
+    y_w = np.where(used, y, 0.)*w
+    M = np.einsum('snp,snq->spq', A_w, A_w)
+    b = np.einsum('snp,sn->sp', A_w, y_w)
+    pcov = np.linalg.pinv(M)
+    popt = np.einsum('spq,sq->sp', pcov, b)
+    residuals = np.where(used, y - np.einsum('snp,sp->sn', np.where(used[..., np.newaxis], A, 0.), popt), np.nan)
+    chi2 = np.nansum((residuals*w)**2, axis=1)
+    dof = np.sum(used, axis=1) - A.shape[-1]
+    if not absolute_sigma:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(dof > 0, chi2/dof, np.inf)
+        pcov = pcov*scale[:, np.newaxis, np.newaxis]
+    unfit = (dof < 0) | (np.linalg.matrix_rank(M) < A.shape[-1])
+    popt[unfit] = np.nan
+    pcov[unfit] = np.nan
+    residuals[unfit] = np.nan
+    chi2[unfit] = np.nan
+    return popt, pcov, residuals, chi2, dof
+
+def _nonneg_sets(A, y, sigma, used, absolute_sigma):
+    n_sets, n_points, n_params = A.shape
+    popt = np.zeros((n_sets, n_params))
+    pcov = np.zeros((n_sets, n_params, n_params))
+    residuals = np.full((n_sets, n_points), np.nan)
+    chi2 = np.zeros(n_sets)
+    dof = np.zeros(n_sets, dtype=int)
+    for k in range(n_sets):
+        u = used[k]
+        if np.sum(u) < n_params or np.linalg.matrix_rank(A[k, u]/sigma[k, u][:, np.newaxis]) < n_params:
+            #Same as the unconstrained sets, nothing to fit
+            popt[k], pcov[k], chi2[k], dof[k] = np.nan, np.nan, np.nan, np.sum(u) - n_params
+            continue
+        popt[k], pcov[k], residuals[k, u], chi2[k], dof[k] = weighted_lstsq(A[k, u], y[k, u], sigma[k, u], absolute_sigma, nonneg=True)
+    return popt, pcov, residuals, chi2, dof
+
+te_default_components = ['phi_int', 'phi_coat']
+
+class TELossCache(object):
+    #Modeled TE loss at (T, f) points, remembered in memory and, if cache_file is given, in an
+    #npz file so later runs (and every temperature after the first) skip the model entirely.
+    #The cache file remembers the model setup it was made with and is ignored if that changed.
+    def __init__(self, components=None, dilution_file=TEModel.default_dilution_file, cache_file=None):
+        self.components = sorted(components if components else te_default_components)
+        self.dilution_file = dilution_file
+        self.cache_file = cache_file
+        self.model = None
+        self.setup = ' '.join(self.components) + ' | ' + str(dilution_file) + ' | ' + repr(sorted(TEModel.default_params.items()))
+        self.values = {}
+        if cache_file is not None and os.path.exists(cache_file):
+            saved = np.load(cache_file)
+            if str(saved['setup']) == self.setup:
+                for T, f, phi in zip(saved['T'], saved['f'], saved['phi_TE']):
+                    self.values[(float(T), float(f))] = float(phi)
+
+    def phi_te(self, T, f):
+        #Phi_TE at every broadcast (T, f) pair, the model is only run for pairs not seen before
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        keys = list(zip(T.ravel().tolist(), f.ravel().tolist()))
+        missing = sorted(set(key for key in keys if key not in self.values and np.isfinite(key[0]) and np.isfinite(key[1])))
+        if len(missing) > 0:
+            self._evaluate(missing)
+        return np.array([self.values.get(key, np.nan) for key in keys]).reshape(T.shape)
+
+    def _evaluate(self, points):
+        if self.model is None:
+            dilution_file = self.dilution_file if 'phi_sub' in self.components else None
+            self.model = TEModel.TEModel(dilution_file)
+        T = np.array([point[0] for point in points])
+        f = np.array([point[1] for point in points])
+        phi = np.full(len(points), np.nan)
+        valid = (T >= self.model.T_range[0]) & (T <= self.model.T_range[1])
+        if np.any(valid):
+            phi[valid] = sum(self.model.evaluate(component, T[valid], f[valid]) for component in self.components)
+        for point, value in zip(points, phi):
+            self.values[point] = float(value)
+        if self.cache_file is not None:
+            self.save()
+
+    def save(self):
+        points = sorted(self.values)
+        np.savez(self.cache_file, setup=np.array(self.setup), T=np.array([p[0] for p in points]), f=np.array([p[1] for p in points]), phi_TE=np.array([self.values[p] for p in points]))
+
+def te_corrected(Phi_tot, Freq, T, D_bu, cache):
+    #Phi_tot - D_bu*Phi_TE. T broadcasts against Freq, e.g. (temperatures, 1) against (temperatures, modes)
+    return np.asarray(Phi_tot, dtype=float) - np.asarray(D_bu, dtype=float)*cache.phi_te(T, Freq)
+
+#Bootstrap confidence intervals. With 8 modes and odd cold data the covariance errors aren't
+#trustworthy, so the fit is repeated on resampled data sets instead:
+#   Pairs    - draw modes with replacement and refit
+#   Residual - keep the modes, add resampled normalized residuals (r/sigma) back onto the fit
+#For the linear model all resamples of a temperature are solved together from their normal
+#equations. Fits without a closed form (non-negative, nonlinear models) go through
+#bootstrap_pool instead, which spreads the refits over worker processes. Resamples that
+#can't pin down every parameter (e.g. the same mode drawn every time) are NaN.
+
+def _resample_rows(rng, n, n_boot):
+    return rng.randint(0, n, size=(n_boot, n))
+
+def bootstrap_linear(A, y, sigma, n_boot=2000, method='Pairs', seed=None):
+    #One data set, A (points, params). Returns (n_boot, params) bootstrap estimates
+    A = np.asarray(A, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    n, n_params = A.shape
+    rng = np.random.RandomState(seed)
+    rows = _resample_rows(rng, n, n_boot)
+    w2 = 1/sigma**2
+    if method == 'Residual':
+        popt = weighted_lstsq(A, y, sigma, absolute_sigma=True)[0]
+        fitted = A.dot(popt)
+        e = (y - fitted)/sigma
+        y_star = fitted + sigma*e[rows]
+        M = np.einsum('n,np,nq->pq', w2, A, A)
+        b = np.einsum('n,np,bn->bp', w2, A, y_star)
+        if np.linalg.matrix_rank(M) < n_params:
+            return np.full((n_boot, n_params), np.nan)
+        return np.linalg.solve(M, b.T).T
+    #Pairs: a resample is the original points weighted by how often each was drawn
+    counts = np.zeros((n_boot, n))
+    np.add.at(counts, (np.arange(n_boot)[:, np.newaxis], rows), 1.)
+    cw = counts*w2
+    M = np.einsum('bn,np,nq->bpq', cw, A, A)
+    b = np.einsum('bn,np,n->bp', cw, A, y)
+    full_rank = np.linalg.matrix_rank(M) == n_params
+    samples = np.full((n_boot, n_params), np.nan)
+    samples[full_rank] = np.linalg.solve(M[full_rank], b[full_rank][..., np.newaxis])[..., 0]
+    return samples
+
+def bootstrap_sets(A, y, sigma, n_boot=2000, method='Pairs', nonneg=False, processes=None, seed=None):
+    #Bootstrap every set of a (sets, points, params) stack, NaN points left out. The
+    #non-negative fit goes through one shared process pool. Returns (sets, n_boot, params)
+    A = np.asarray(A, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    rng = np.random.RandomState(seed)
+    samples = np.full((A.shape[0], n_boot, A.shape[-1]), np.nan)
+    pool = multiprocessing.Pool(processes) if nonneg else None
+    try:
+        for k in range(A.shape[0]):
+            u = np.isfinite(y[k]) & np.isfinite(sigma[k]) & np.all(np.isfinite(A[k]), axis=-1)
+            if nonneg:
+                samples[k] = bootstrap_pool(NonNegLinearFit(), A[k, u], y[k, u], sigma[k, u], n_boot, method, processes, rng.randint(2**31 - 1), pool)
+            else:
+                samples[k] = bootstrap_linear(A[k, u], y[k, u], sigma[k, u], n_boot, method, rng.randint(2**31 - 1))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return samples
+
+def confidence_intervals(samples, interval=0.95):
+    #Lower and upper ends of the central interval along the resample axis (second to last)
+    low, high = np.nanpercentile(samples, [50*(1 - interval), 50*(1 + interval)], axis=-2)
+    return low, high
+
+
+class NonNegLinearFit(object):
+    #Fit object for bootstrap_pool: X is the design matrix, parameters forced >= 0
+    n_params = 2
+
+    def fit(self, X, y, sigma):
+        return weighted_lstsq(X, y, sigma, absolute_sigma=True, nonneg=True)[0]
+
+    def predict(self, X, popt):
+        return np.asarray(X, dtype=float).dot(popt)
+
+def _bootstrap_chunk(job):
+    #Worker for bootstrap_pool: refits one chunk of resamples
+    fit, X, y, sigma, rows, y_star = job
+    samples = np.full((len(rows), fit.n_params), np.nan)
+    for k in range(len(rows)):
+        idx = rows[k]
+        y_k = y[idx] if y_star is None else y_star[k][idx]
+        if len(np.unique(idx)) < fit.n_params:
+            continue
+        try:
+            samples[k] = fit.fit(X[idx], y_k, sigma[idx])
+        except (RuntimeError, ValueError, np.linalg.LinAlgError):
+            pass
+    return samples
+
+def bootstrap_pool(fit, X, y, sigma, n_boot=2000, method='Pairs', processes=None, seed=None, pool=None):
+    #Bootstrap any fit object with fit(X, y, sigma) -> popt, predict(X, popt) and n_params.
+    #X holds one row of independent data per point. The resamples are split into chunks
+    #and refit in a process pool (pass pool to reuse one). Returns (n_boot, params)
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    n = len(y)
+    rng = np.random.RandomState(seed)
+    y_star = None
+    if method == 'Residual':
+        fitted = fit.predict(X, fit.fit(X, y, sigma))
+        y_star = fitted + sigma*((y - fitted)/sigma)[_resample_rows(rng, n, n_boot)]
+        rows = np.tile(np.arange(n), (n_boot, 1))
+    else:
+        rows = _resample_rows(rng, n, n_boot)
+    n_chunks = 4*(processes or multiprocessing.cpu_count())
+    edges = np.linspace(0, n_boot, n_chunks + 1).astype(int)
+    jobs = [(fit, X, y, sigma, rows[a:b], None if y_star is None else y_star[a:b]) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+    own_pool = pool is None
+    if own_pool:
+        pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_bootstrap_chunk, jobs)
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+    return np.concatenate(results)
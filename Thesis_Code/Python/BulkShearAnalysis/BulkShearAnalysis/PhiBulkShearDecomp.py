@@ -1,129 +1,235 @@
-#This script takes in the frequencies, loss angles, modeled TE loss (eventually)
+#This script takes in the frequencies, loss angles, modeled TE loss (optional)
 #and standard deviations in loss for a given temperature. It also takes in
 #the coating bulk/shear dilution factors at each frequency. It then performs a fit of the following equation
-#assuming shear is constant across frequency and bulk scales with f:
+#assuming shear is constant across frequency and bulk is constant too (or scales with f, see bulk_linear_in_freq):
 #Phi(imported) = D_shear*Phi_shear + D_bulk*(Phi_bulk + Phi_TE)
 #python4mpia.github.io/fitting_data/least-squares-fitting.html for reference info. Comments will reference this page.
-#For now this program runs one temperature at a time.
-#TE has yet to be added, but once 12 K decomposition works, the modeled TE
-#will be added to be run at warmer temperatures
+#It runs one temperature at a time, or every <T>K_ModeFreqVsPhi.txt file at once in All mode.
+#The modeled TE loss (from TEModel.py in Thermoelastic Modeling) can be subtracted before the fit,
+#Phi_TE is evaluated at each mode frequency and temperature and cached in TELossCache.npz next to the data.
+#Models mode fits constant, linear, power law and loss peak frequency dependence for bulk and shear
+#(BulkShearModels.py) to every temperature and ranks them by AIC or BIC.
 
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-
-#Ask the user what temperature we are fitting the loss at
-print("What temperature is the loss data being fit at? Please enter an integer below:")
-Temperature_str = raw_input()
-Temperature_in = int(Temperature_str)
-
-#Read in the frequencies and the associated dilution factors and total losses at those frequencies
-print("Please enter the data file that holds the mode frequencies, loss, and standard deviation:")
-loss_file = raw_input()
-Freq = {}
-Phi_tot = {}
-Std_tot = {}
-with open(loss_file) as f:
-    lines = f.readlines()
-    Freq = [line.split()[0] for line in lines]
-    Phi_tot = [line.split()[1] for line in lines]
-    Std_tot = [line.split()[2] for line in lines]
-i = 0
-while i < len(Freq) - 0.5:
-    Freq[i] = float(Freq[i])
-    Phi_tot[i] = float(Phi_tot[i])
-    Std_tot[i] = float(Std_tot[i])
-    i += 1
-
-#Read in the dilution factors, and tell the user to make sure they line up with the frequency/loss file
-print("Please enter the text file that holds the dilution factors. Bulk should be the first column, and shear the right. Make sure they line up row by row with the correct frequency from the previous file:")
-dilution_file = raw_input()
-D_bu = {}
-D_sh = {}
-with open(dilution_file) as f:
-    lines = f.readlines()
-    D_bu = [line.split()[0] for line in lines]
-    D_sh = [line.split()[1] for line in lines]
-i = 0
-while i < len(D_bu) - 0.5:
-    D_bu[i] = float(D_bu[i])
-    D_sh[i] = float(D_sh[i])
-    i += 1
-
-#Define the model we will be fitting then perform the fit on that model. Stack overflow
-#"Python curve_fit with multiple independent variables" for info on how this works.
-def model(I, Phi_bu, Phi_sh):
-    #The Dilution factors, and frequency are our data (I=independent variables)
-    #and everything else is parameters to be fit.
-    Freq, D_bu, D_sh = I
-    #Phi_tot_fit = D_sh*Phi_sh + D_bu*Phi_bu*Freq
-    #Above line assumes linear scaling of Phi_bu with frequency
-    Phi_tot_fit = D_sh*Phi_sh + D_bu*Phi_bu
-    #Above line assumes no scaling of Phi_bu with frequency
-    return Phi_tot_fit
-
-#Fit it. But jump around the initial parameter space and keep the fit that minimizes the residuals.
-i = 0.
-j = 0.
-k = 0.
-N_start = 50 #N_start**2 is the number of starting positions to be tested across the parameter space
-Phi_sh_guess = 10.**-30
-Phi_bu_guess = 10.**-30
-perr = 10000000 #Initialize the error that we will compare at the end of each fit guess
-popt = 'Start'
-pcov = 'Start'
-while i < N_start - 0.5:
-    j = 0
-    while j < N_start - 0.5:
-        guess = np.array([Phi_bu_guess*(1.+10.**(i/2)), Phi_sh_guess*(1.+10.**(j/2))])
-        #^Change starting position of our three guesses
-        #popt_new, pcov_new = curve_fit(model, (Freq, D_bu, D_sh), Phi_tot, guess, sigma=Std_tot, bounds=(0, [10.**-1, 10.**-1]))
-        popt_new, pcov_new = curve_fit(model, (Freq, D_bu, D_sh), Phi_tot, guess, sigma=Std_tot)
-        perrdiag_new = np.sqrt(np.diag(pcov_new))
-        perr_new = np.dot(perrdiag_new, perrdiag_new)
-        if perr_new < perr:
-            print(popt, perr)
-            popt = popt_new
-            pcov = pcov_new
-            perr = perr_new
-        j += 1
-    print(i)
-    i += 1
-
-print(popt, perr)
-
-#Note popt[0] = Phi_bu     popt[1] = Phi_sh
-StdModel = np.zeros(len(Freq))
-Phi_tot_fit = np.zeros(len(Freq))
-i = 0
-while i < len(Freq) - 0.5:
-    #Phi_tot_fit[i] = D_sh[i]*popt[1] + D_bu[i]*popt[0]*Freq[i]
-    #Above line assumes linear scaling between Phi_Bu and frequency
-    Phi_tot_fit[i] = D_sh[i]*popt[1] + D_bu[i]*popt[0]
-    #Above line assumes no scaling of Phi_bu with frequency
-    i += 1
-plt.errorbar(Freq, Phi_tot, Std_tot, linestyle='None', label='Total Loss Data', marker='o')
-plt.errorbar(Freq, Phi_tot_fit, StdModel, label = 'Fitted Loss', marker='x')
-i = 0
-FreqModel = np.linspace(300, 10000, 100)
-Phi_bu = np.zeros(len(FreqModel))
-Phi_sh = np.zeros(len(FreqModel))
-Phi_TE = np.zeros(len(FreqModel))
-StdModel = np.zeros(len(FreqModel))
-while i < len(FreqModel) - 0.5:
-    #Phi_bu[i] = popt[0]*FreqModel[i]
-    #Above line assumes linear scaling between Phi_Bu and frequency
-    Phi_bu[i] = popt[0]
-    #Above line assumes no scaling between Phi_Bu and frequency
-    Phi_sh[i] = popt[1]
-    i += 1
-plt.errorbar(FreqModel, Phi_bu, StdModel, label = 'Bulk Loss', marker = 'None')
-plt.errorbar(FreqModel, Phi_sh, StdModel, label = 'Shear Loss', marker = 'None')
-ax = plt.gca()
-ax.set_yscale('log')
-plt.xlabel("Frequency (Hz)")
-plt.ylabel("Loss Angle")
-plt.title("AlGaAs " + Temperature_str + "K Loss vs Mode Frequency: Bulk Shear Decomposition")
-plt.grid()
-plt.legend()
-plt.show()
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import ColumnLoader
+import BulkShearTools
+import BulkShearModels
+import TEModel
+
+def ask_te_cache(cache_dir):
+    #Asks whether to subtract the modeled thermoelastic loss and which components make it up.
+    #Returns a BulkShearTools.TELossCache saving to TELossCache.npz in cache_dir, or None for no
+    #subtraction.
+    print("Do you want to subtract the modeled thermoelastic loss D_bu*Phi_TE before fitting? (Y/N):")
+    if raw_input() != 'Y':
+        return None
+    print("Which TE components make up Phi_TE? (any of phi_int phi_sub phi_coat, leave blank for phi_int phi_coat):")
+    te_components = raw_input().split()
+    te_dilution_file = TEModel.default_dilution_file
+    if 'phi_sub' in te_components:
+        print("Please enter the substrate dilution factor file for phi_sub (leave blank for the AlGaAs test data):")
+        te_dilution_text = raw_input()
+        if te_dilution_text != '':
+            te_dilution_file = te_dilution_text
+    return BulkShearTools.TELossCache(te_components, te_dilution_file, os.path.join(cache_dir, 'TELossCache.npz'))
+
+if __name__ == '__main__':
+    #The non-negative bootstrap runs in worker processes, they need this guard
+    #Ask the user whether to fit one temperature or all of them
+    print("Do you want to fit one temperature, every <T>K_ModeFreqVsPhi.txt file in a directory at once, or compare frequency dependence models on every file? (Single/All/Models):")
+    Run_ans = raw_input()
+
+    if Run_ans == 'All':
+        #Every temperature file is stacked into (temperature, mode) arrays and all the fits are solved together
+        print("Please enter the directory holding the <T>K_ModeFreqVsPhi.txt files (leave blank for this script's directory):")
+        data_dir = raw_input()
+        if data_dir == '':
+            data_dir = os.path.dirname(os.path.abspath(__file__))
+        print("Please enter the text file that holds the dilution factors. Bulk should be the first column, and shear the right. Make sure they line up row by row with the modes in the data files:")
+        dilution_file = raw_input()
+        print("Do you want to force the bulk and shear loss angles to be non-negative? (Y/N):")
+        nonneg_ans = raw_input()
+        #Optionally take the modeled thermoelastic loss out first, Phi_tot - D_bu*Phi_TE (see BulkShearTools.py)
+        te_cache = ask_te_cache(data_dir)
+        #Bootstrap confidence intervals, see BulkShearTools.py
+        print("How many bootstrap resamples do you want for 95% confidence intervals? (e.g. 5000, leave blank to skip):")
+        n_boot_text = raw_input()
+        if n_boot_text != '':
+            n_boot = int(n_boot_text)
+            print("Do you want to resample the modes or the residuals? (Pairs/Residual):")
+            boot_method = raw_input()
+        print("Please enter the file name to write the bulk and shear loss angles to:")
+        output_file = raw_input()
+
+        bulk_linear_in_freq = False #Same switch as in the single temperature fit below
+        Temps, Freq, Phi_tot, Std_tot = BulkShearTools.load_temperature_stack(data_dir)
+        D_bu, D_sh = ColumnLoader.load_columns(dilution_file, 2)
+        if te_cache is not None:
+            Phi_tot = BulkShearTools.te_corrected(Phi_tot, Freq, Temps[:, np.newaxis], D_bu, te_cache)
+        A = BulkShearTools.design_matrix(Freq, D_bu, D_sh, bulk_linear_in_freq)
+        popt, pcov, residuals, chi2, dof = BulkShearTools.batched_lstsq(A, Phi_tot, Std_tot, nonneg=(nonneg_ans == 'Y'))
+        perr = np.sqrt(np.diagonal(pcov, axis1=1, axis2=2))
+        #Error bars are the covariance errors, or the bootstrap intervals if we have them
+        err_bu = perr[:, 0]
+        err_sh = perr[:, 1]
+        if n_boot_text != '':
+            samples = BulkShearTools.bootstrap_sets(A, Phi_tot, Std_tot, n_boot, boot_method, nonneg=(nonneg_ans == 'Y'))
+            ci_low, ci_high = BulkShearTools.confidence_intervals(samples, 0.95)
+            err_bu = [np.clip(popt[:, 0] - ci_low[:, 0], 0, None), np.clip(ci_high[:, 0] - popt[:, 0], 0, None)]
+            err_sh = [np.clip(popt[:, 1] - ci_low[:, 1], 0, None), np.clip(ci_high[:, 1] - popt[:, 1], 0, None)]
+
+        with open(output_file, 'w') as f:
+            if n_boot_text != '':
+                f.write('#T(K) Phi_bu Std_bu Phi_sh Std_sh chi^2 dof Phi_bu_95Low Phi_bu_95High Phi_sh_95Low Phi_sh_95High\n')
+            else:
+                f.write('#T(K) Phi_bu Std_bu Phi_sh Std_sh chi^2 dof\n')
+            for k in range(len(Temps)):
+                line = str(Temps[k]) + ' ' + str(popt[k, 0]) + ' ' + str(perr[k, 0]) + ' ' + str(popt[k, 1]) + ' ' + str(perr[k, 1]) + ' ' + str(chi2[k]) + ' ' + str(dof[k])
+                if n_boot_text != '':
+                    line = line + ' ' + str(ci_low[k, 0]) + ' ' + str(ci_high[k, 0]) + ' ' + str(ci_low[k, 1]) + ' ' + str(ci_high[k, 1])
+                f.write(line + '\n')
+        print("Bulk and shear loss angles for " + str(len(Temps)) + " temperatures written to " + output_file)
+
+        plt.errorbar(Temps, popt[:, 0], err_bu, label='Bulk Loss', linestyle='None', marker='o')
+        plt.errorbar(Temps, popt[:, 1], err_sh, label='Shear Loss', linestyle='None', marker='s')
+        ax = plt.gca()
+        ax.set_yscale('log')
+        plt.xlabel("Temperature (K)")
+        plt.ylabel("Loss Angle")
+        plt.title("AlGaAs Bulk Shear Decomposition vs Temperature")
+        plt.grid()
+        plt.legend()
+        plt.show()
+
+    elif Run_ans == 'Models':
+        #Every combination of bulk and shear frequency dependence is fit at every temperature in parallel
+        print("Please enter the directory holding the <T>K_ModeFreqVsPhi.txt files (leave blank for this script's directory):")
+        data_dir = raw_input()
+        if data_dir == '':
+            data_dir = os.path.dirname(os.path.abspath(__file__))
+        print("Please enter the text file that holds the dilution factors. Bulk should be the first column, and shear the right. Make sure they line up row by row with the modes in the data files:")
+        dilution_file = raw_input()
+        te_cache = ask_te_cache(data_dir)
+        print("Do you want to rank the models by AIC or BIC? (AIC/BIC):")
+        criterion = raw_input()
+        while criterion not in ('AIC', 'BIC'):
+            print("Please enter AIC or BIC:")
+            criterion = raw_input()
+        print("Please enter the file name to write the model ranking to:")
+        output_file = raw_input()
+
+        Temps, Freq, Phi_tot, Std_tot = BulkShearTools.load_temperature_stack(data_dir)
+        D_bu, D_sh = ColumnLoader.load_columns(dilution_file, 2)
+        if te_cache is not None:
+            Phi_tot = BulkShearTools.te_corrected(Phi_tot, Freq, Temps[:, np.newaxis], D_bu, te_cache)
+        ranked = BulkShearModels.compare_models(Freq, D_bu, D_sh, Phi_tot, Std_tot, criterion)
+
+        #One line per model per temperature, best first. Models are named bulk form/shear form
+        with open(output_file, 'w') as f:
+            f.write('#T(K) rank model k chi^2 AIC BIC d' + criterion + ' parameters(name=value+-error)\n')
+            for k in range(len(Temps)):
+                best = ranked[k][0][criterion]
+                for rank in range(len(ranked[k])):
+                    row = ranked[k][rank]
+                    line = str(Temps[k]) + ' ' + str(rank + 1) + ' ' + row['name'] + ' ' + str(row['k']) + ' ' + str(row['chi2']) + ' ' + str(row['AIC']) + ' ' + str(row['BIC']) + ' ' + str(row[criterion] - best)
+                    for name, value, error in zip(row['param_names'], row['popt'], row['perr']):
+                        line = line + ' ' + name + '=' + str(value) + '+-' + str(error)
+                    f.write(line + '\n')
+        for k in range(len(Temps)):
+            best = ranked[k][0]
+            runner_up = ranked[k][1]
+            print(str(Temps[k]) + "K best: " + best['name'] + " (" + criterion + " lower than " + runner_up['name'] + " by " + str(runner_up[criterion] - best[criterion]) + ")")
+            for name, value, error in zip(best['param_names'], best['popt'], best['perr']):
+                print("    " + name + " = " + str(value) + " +- " + str(error))
+        print("Model ranking for " + str(len(Temps)) + " temperatures written to " + output_file)
+
+        #Criterion difference from the best model at each temperature, near 0 means as good as the best
+        for model in BulkShearModels.all_models():
+            delta = [[row[criterion] - ranked[k][0][criterion] for row in ranked[k] if row['name'] == model.name][0] for k in range(len(Temps))]
+            plt.plot(Temps, delta, label=model.name, marker='o')
+        plt.ylim(0, 20)
+        plt.xlabel("Temperature (K)")
+        plt.ylabel("d" + criterion + " from best model")
+        plt.title("AlGaAs Bulk/Shear Frequency Dependence Model Comparison")
+        plt.grid()
+        plt.legend(fontsize='small', ncol=2)
+        plt.show()
+
+    else:
+        #Ask the user what temperature we are fitting the loss at
+        print("What temperature is the loss data being fit at? Please enter an integer below:")
+        Temperature_str = raw_input()
+        Temperature_in = int(Temperature_str)
+
+        #Read in the frequencies and the associated dilution factors and total losses at those frequencies
+        print("Please enter the data file that holds the mode frequencies, loss, and standard deviation:")
+        loss_file = raw_input()
+        Freq, Phi_tot, Std_tot = ColumnLoader.load_columns(loss_file, 3)
+
+        #Read in the dilution factors, and tell the user to make sure they line up with the frequency/loss file
+        print("Please enter the text file that holds the dilution factors. Bulk should be the first column, and shear the right. Make sure they line up row by row with the correct frequency from the previous file:")
+        dilution_file = raw_input()
+        D_bu, D_sh = ColumnLoader.load_columns(dilution_file, 2)
+
+        #The model is linear in Phi_bu and Phi_sh, so BulkShearTools solves the sigma weighted least squares
+        #problem directly (exact best fit, no starting guesses needed). See BulkShearTools.py for details.
+        #Set bulk_linear_in_freq to True below to assume linear scaling of Phi_bu with frequency
+        #(Phi_tot = D_sh*Phi_sh + D_bu*Phi_bu*Freq) instead of no scaling. Models mode compares
+        #these and other frequency dependences properly.
+        bulk_linear_in_freq = False
+        print("Do you want to force the bulk and shear loss angles to be non-negative? (Y/N):")
+        nonneg_ans = raw_input()
+        #Optionally take the modeled thermoelastic loss out first, Phi_tot - D_bu*Phi_TE (see BulkShearTools.py)
+        te_cache = ask_te_cache(os.path.dirname(os.path.abspath(loss_file)))
+        #Bootstrap confidence intervals, see BulkShearTools.py
+        print("How many bootstrap resamples do you want for 95% confidence intervals? (e.g. 5000, leave blank to skip):")
+        n_boot_text = raw_input()
+        if n_boot_text != '':
+            n_boot = int(n_boot_text)
+            print("Do you want to resample the modes or the residuals? (Pairs/Residual):")
+            boot_method = raw_input()
+        Phi_fit_data = Phi_tot
+        if te_cache is not None:
+            #Modes the TE model can't reach come back NaN and are left out of the fit
+            Phi_fit_data = BulkShearTools.te_corrected(Phi_tot, Freq, Temperature_in, D_bu, te_cache)
+        A = BulkShearTools.design_matrix(Freq, D_bu, D_sh, bulk_linear_in_freq)
+        fit_rows = np.isfinite(Phi_fit_data)
+        popt, pcov, residuals, chi2, dof = BulkShearTools.weighted_lstsq(A[fit_rows], Phi_fit_data[fit_rows], Std_tot[fit_rows], nonneg=(nonneg_ans == 'Y'))
+        perr = np.sqrt(np.diag(pcov))
+
+        #Note popt[0] = Phi_bu     popt[1] = Phi_sh
+        print("Phi_bu = " + str(popt[0]) + " +- " + str(perr[0]))
+        print("Phi_sh = " + str(popt[1]) + " +- " + str(perr[1]))
+        print("chi^2 = " + str(chi2) + " for " + str(dof) + " degrees of freedom")
+        if n_boot_text != '':
+            samples = BulkShearTools.bootstrap_sets(A[fit_rows][np.newaxis], Phi_fit_data[fit_rows][np.newaxis], Std_tot[fit_rows][np.newaxis], n_boot, boot_method, nonneg=(nonneg_ans == 'Y'))
+            ci_low, ci_high = BulkShearTools.confidence_intervals(samples[0], 0.95)
+            print("Phi_bu 95% bootstrap interval: " + str(ci_low[0]) + " to " + str(ci_high[0]))
+            print("Phi_sh 95% bootstrap interval: " + str(ci_low[1]) + " to " + str(ci_high[1]))
+        Phi_tot_fit = A.dot(popt)
+        if te_cache is not None:
+            Phi_tot_fit = Phi_tot_fit + (Phi_tot - Phi_fit_data) #Put the TE loss back in to compare with the data
+        StdModel = np.zeros(len(Freq))
+        plt.errorbar(Freq, Phi_tot, Std_tot, linestyle='None', label='Total Loss Data', marker='o')
+        plt.errorbar(Freq, Phi_tot_fit, StdModel, label = 'Fitted Loss', marker='x')
+        FreqModel = np.linspace(300, 10000, 100)
+        if bulk_linear_in_freq:
+            Phi_bu = popt[0]*FreqModel
+        else:
+            Phi_bu = popt[0]*np.ones(len(FreqModel))
+        Phi_sh = popt[1]*np.ones(len(FreqModel))
+        plt.errorbar(FreqModel, Phi_bu, perr[0]*(FreqModel if bulk_linear_in_freq else 1), label = 'Bulk Loss', marker = 'None', errorevery=10)
+        plt.errorbar(FreqModel, Phi_sh, perr[1], label = 'Shear Loss', marker = 'None', errorevery=10)
+        ax = plt.gca()
+        ax.set_yscale('log')
+        plt.xlabel("Frequency (Hz)")
+        plt.ylabel("Loss Angle")
+        plt.title("AlGaAs " + Temperature_str + "K Loss vs Mode Frequency: Bulk Shear Decomposition")
+        plt.grid()
+        plt.legend()
+        plt.show()
@@ -0,0 +1,196 @@
+#Shared pieces of the coating loss extraction, used by PhiCoatExtractor.py. stream_coating works
+#through ringdown logs of any size, and the batch functions at the bottom run the extraction
+#for a whole directory of modes in worker processes.
+#
+#match_substrate lines the substrate data up with the coated sample temperatures. Both data
+#sets are sorted once and the coated temperatures are looked up with searchsorted, so every
+#point is handled in one pass no matter how many temperatures there are or whether they are
+#whole numbers (20.5 K works). Where the substrate was measured at exactly the same
+#temperature that value is used, otherwise the substrate loss and standard deviation are
+#linearly interpolated between the nearest two substrate temperatures. Coated temperatures
+#outside the substrate range take the nearest end point, same as np.interp.
+#
+#coating_loss then applies
+#   Phi_coat = (1/D)*Phi_tot + (1 - 1/D)*Phi_sub
+#   Std_coat = sqrt((1/D)*Std_tot^2 + |1 - 1/D|*Std_sub^2)
+
+import os
+import re
+import glob
+import sys
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import PhiQConversion
+import ColumnLoader
+
+class SubstrateTable(object):
+    #The substrate data sorted once, so any number of coated temperatures (e.g. chunk after
+    #chunk of a ringdown log) can be matched against it
+    def __init__(self, T_sub, Phi_sub, Std_sub):
+        order = np.argsort(np.asarray(T_sub, dtype=float), kind='mergesort')
+        self.T_sub = np.asarray(T_sub, dtype=float)[order]
+        self.Phi_sub = np.asarray(Phi_sub, dtype=float)[order]
+        self.Std_sub = np.asarray(Std_sub, dtype=float)[order]
+
+    def match(self, T_tot):
+        #Returns the substrate loss and standard deviation at each coated temperature
+        T_tot = np.asarray(T_tot, dtype=float)
+        Phi_match = np.interp(T_tot, self.T_sub, self.Phi_sub)
+        Std_match = np.interp(T_tot, self.T_sub, self.Std_sub)
+        #Exact matches: the last substrate point at or below each temperature, if it is equal
+        index = np.searchsorted(self.T_sub, T_tot, side='right') - 1
+        exact = (index >= 0)
+        exact[exact] = self.T_sub[index[exact]] == T_tot[exact]
+        Phi_match[exact] = self.Phi_sub[index[exact]]
+        Std_match[exact] = self.Std_sub[index[exact]]
+        return Phi_match, Std_match
+
+def match_substrate(T_tot, T_sub, Phi_sub, Std_sub):
+    return SubstrateTable(T_sub, Phi_sub, Std_sub).match(T_tot)
+
+def coating_loss(Phi_tot, Std_tot, Phi_sub, Std_sub, D):
+    Phi_tot = np.asarray(Phi_tot, dtype=float)
+    Std_tot = np.asarray(Std_tot, dtype=float)
+    Phi_coat = (1./D)*Phi_tot + (1-(1./D))*Phi_sub
+    Std_coat = ((1./D)*(Std_tot**2) + abs(1-(1./D))*(Std_sub**2))**0.5
+    return Phi_coat, Std_coat
+
+def extract_coating(T_tot, Phi_tot, Std_tot, T_sub, Phi_sub, Std_sub, D):
+    #Coating loss and standard deviation at every coated sample temperature
+    Phi_sub_match, Std_sub_match = match_substrate(T_tot, T_sub, Phi_sub, Std_sub)
+    return coating_loss(Phi_tot, Std_tot, Phi_sub_match, Std_sub_match, D)
+
+def coating_result(T_tot, Phi_tot, Std_tot, T_sub, Phi_sub, Std_sub, D, Ans, errors='', Std_D=0.):
+    #Coating Phi or Q (Ans) at every coated sample temperature, with lower and upper errors.
+    #errors is 'Linear', 'MonteCarlo' or anything else for the original formula above. The
+    #original Q error is the full width 1/(Phi - Std) - 1/(Phi + Std), as it has always been written.
+    Phi_sub_match, Std_sub_match = match_substrate(T_tot, T_sub, Phi_sub, Std_sub)
+    return matched_result(Phi_tot, Std_tot, Phi_sub_match, Std_sub_match, D, Ans, errors, Std_D)
+
+def matched_result(Phi_tot, Std_tot, Phi_sub_match, Std_sub_match, D, Ans, errors='', Std_D=0.):
+    #coating_result once the substrate is already matched to the coated temperatures
+    if errors == 'MonteCarlo':
+        mc = PhiQConversion.coating_loss_monte_carlo(Phi_tot, Std_tot, Phi_sub_match, Std_sub_match, D, Std_D)
+        return mc[Ans], mc[Ans] - mc[Ans + '_lower'], mc[Ans + '_upper'] - mc[Ans]
+    if errors == 'Linear':
+        Phi_coat, Std_coat = PhiQConversion.coating_loss_linear(Phi_tot, Std_tot, Phi_sub_match, Std_sub_match, D, Std_D)
+        if Ans == 'Q':
+            Phi_coat, Std_coat = PhiQConversion.phi_to_q(Phi_coat, Std_coat)
+        return Phi_coat, Std_coat, Std_coat
+    Phi_coat, Std_coat = coating_loss(Phi_tot, Std_tot, Phi_sub_match, Std_sub_match, D)
+    if Ans == 'Q':
+        Q_coat, Q_lower, Q_upper = PhiQConversion.q_interval(Phi_coat, Std_coat)
+        return Q_coat, Q_lower + Q_upper, Q_lower + Q_upper
+    return Phi_coat, Std_coat, Std_coat
+
+def write_coating(output_file, T_coat, Y_coat, Err_lower, Err_upper, asymmetric):
+    #3 columns (temperature, value, error), or 4 with separate lower and upper errors
+    with open(output_file, 'w') as f:
+        write_rows(f, T_coat, Y_coat, Err_lower, Err_upper, asymmetric)
+
+def write_rows(f, T_coat, Y_coat, Err_lower, Err_upper, asymmetric):
+    for i in range(len(T_coat)):
+        if asymmetric:
+            f.write(str(T_coat[i]) + " " + str(Y_coat[i]) + " " + str(Err_lower[i]) + " " + str(Err_upper[i]) + "\n")
+        else:
+            f.write(str(T_coat[i]) + " " + str(Y_coat[i]) + " " + str(Err_lower[i]) + "\n")
+
+#Streaming extraction for raw per-ringdown loss logs that are too big to read in at once.
+#The coated log is read stream_block_bytes of text at a time, each block is matched against
+#the substrate (held in memory, it is small) and its coating loss is appended to the output
+#file before the next block is read, so memory use doesn't grow with the log. The log needs
+#temperature and loss columns, the standard deviation column is optional (0 if missing).
+stream_block_bytes = 4*(2**20)
+
+def stream_coating(coated_file, output_file, substrate, D, Ans, errors='', Std_D=0., block_bytes=stream_block_bytes):
+    #substrate is a SubstrateTable. Returns the number of rows written.
+    n_rows = 0
+    with open(output_file, 'w') as f:
+        for block in ColumnLoader.iter_table(coated_file, block_bytes):
+            T_tot = block[:, 0]
+            Phi_tot = block[:, 1]
+            Std_tot = block[:, 2] if block.shape[1] > 2 else np.zeros(len(block))
+            Phi_sub_match, Std_sub_match = substrate.match(T_tot)
+            Y_coat, Err_lower, Err_upper = matched_result(Phi_tot, Std_tot, Phi_sub_match, Std_sub_match, D, Ans, errors, Std_D)
+            write_rows(f, T_tot, Y_coat, Err_lower, Err_upper, errors == 'MonteCarlo')
+            n_rows += len(block)
+    return n_rows
+
+#Batch extraction. Coated and substrate files are "Mode N Averaged Phi <f>Hz.txt" style
+#names in two directories, paired by mode number. The dilution factor table has the mode
+#number or the mode frequency in the first column and D in the second. Frequency keys are
+#matched to the nearest table frequency, and only if it is within freq_tolerance (relative)
+#so a mode missing from the table is skipped instead of borrowing its neighbor's D.
+mode_pattern = re.compile(r'Mode (\d+)')
+freq_pattern = re.compile(r'([0-9.]+) ?Hz')
+freq_tolerance = 0.02
+
+def mode_files(directory):
+    #Dictionary of mode number -> (file name, frequency or None) for the Averaged Phi files
+    files = {}
+    for filename in sorted(glob.glob(os.path.join(directory, '*Averaged Phi*.txt'))):
+        name = os.path.basename(filename)
+        mode = mode_pattern.search(name)
+        if mode is None:
+            continue
+        freq = freq_pattern.search(name)
+        files[int(mode.group(1))] = (filename, float(freq.group(1)) if freq is not None else None)
+    return files
+
+def load_dilution_table(filename):
+    return ColumnLoader.load_columns(filename, 2)
+
+def lookup_dilution(keys, D_table, mode, freq, by_freq):
+    #D for one mode, or None if the table doesn't have it
+    if not by_freq:
+        found = np.nonzero(keys == mode)[0]
+        return float(D_table[found[0]]) if len(found) > 0 else None
+    if freq is None:
+        return None
+    nearest = np.argmin(np.abs(keys - freq))
+    if abs(keys[nearest] - freq) > freq_tolerance*freq:
+        return None
+    return float(D_table[nearest])
+
+def batch_jobs(coated_dir, substrate_dir, dilution_file, by_freq, output_dir, Ans, errors='', Std_D=0.):
+    #Pair everything up. Returns the jobs for extract_mode and a list of skipped modes with reasons.
+    #Std_D is the dilution factor uncertainty for the Linear and MonteCarlo errors, the same for every mode
+    coated = mode_files(coated_dir)
+    substrate = mode_files(substrate_dir)
+    keys, D_table = load_dilution_table(dilution_file)
+    jobs = []
+    skipped = []
+    for mode in sorted(coated):
+        coated_file, freq = coated[mode]
+        if mode not in substrate:
+            skipped.append((mode, 'no substrate file'))
+            continue
+        D = lookup_dilution(keys, D_table, mode, freq, by_freq)
+        if D is None:
+            skipped.append((mode, 'not in the dilution factor table'))
+            continue
+        if Ans == 'Q':
+            output_file = os.path.join(output_dir, 'Coating Mode ' + str(mode) + ' Averaged Q.txt')
+        else:
+            output_file = os.path.join(output_dir, 'Coating ' + os.path.basename(coated_file))
+        jobs.append((mode, coated_file, substrate[mode][0], D, output_file, Ans, errors, Std_D))
+    return jobs, skipped
+
+def extract_mode(job):
+    #Worker for the batch pool: one mode from files to output file
+    mode, coated_file, substrate_file, D, output_file, Ans, errors, Std_D = job
+    tot = ColumnLoader.load_table(coated_file)
+    sub = ColumnLoader.load_table(substrate_file)
+    Y_coat, Err_lower, Err_upper = coating_result(tot[:, 0], tot[:, 1], tot[:, 2], sub[:, 0], sub[:, 1], sub[:, 2], D, Ans, errors, Std_D)
+    write_coating(output_file, tot[:, 0], Y_coat, Err_lower, Err_upper, errors == 'MonteCarlo')
+    return mode, tot[:, 0], Y_coat, Err_lower, Err_upper
+
+def run_batch(jobs, processes=None):
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(extract_mode, jobs)
+    finally:
+        pool.close()
+        pool.join()
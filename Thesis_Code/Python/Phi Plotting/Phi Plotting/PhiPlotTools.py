@@ -0,0 +1,263 @@
+#Batch plotting for PhiPlotter.py. Instead of typing in every file name and getting one
+#interactive window, a directory or glob pattern (e.g. "Mode *" or "Samples/*/Mode *") is
+#plotted straight to image files:
+#   <mode>_Q.png, <mode>_Phi.png            - one figure per file
+#   <folder>_Q.png, <folder>_Phi.png        - all the files from one folder together
+#With files from several folders the image names start with the folder, <folder>_<mode>_Q.png.
+#Figures are drawn with the Agg backend on Figure objects (no pyplot, no windows), one figure
+#per job in a pool of worker processes, so dozens of modes and samples take seconds.
+#
+#LiveLossPlot is the Watch mode. It keeps one errorbar per file on a single set of axes and
+#polls the folder: new files get a new errorbar, and for files that grew only the bytes added
+#since the last read are parsed (a half written last line is held back until it's finished)
+#and the existing errorbar artists are updated in place. Redraws happen at most once every
+#redraw_interval seconds however many files change.
+
+import os
+import re
+import glob
+import time
+import multiprocessing
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import PhiQConversion
+import ColumnLoader
+
+mode_pattern = re.compile(r'Mode (\d+)')
+image_dpi = 150
+poll_interval = 2. #Seconds between checks of the files in Watch mode
+redraw_interval = 5. #Minimum seconds between redraws in Watch mode
+
+def find_files(path):
+    #Files to plot from a directory (every non hidden file that isn't a script or readme) or a
+    #glob pattern, sorted by folder and then mode number
+    if os.path.isdir(path):
+        candidates = [os.path.join(path, name) for name in os.listdir(path)]
+    else:
+        candidates = glob.glob(path)
+    files = [name for name in candidates if os.path.isfile(name) and not os.path.basename(name).startswith('.')
+             and not name.endswith('.py') and not name.endswith('.png') and os.path.basename(name) != 'README.txt']
+    def sort_key(name):
+        mode = mode_pattern.search(os.path.basename(name))
+        return (os.path.dirname(name), int(mode.group(1)) if mode is not None else float('inf'), name)
+    return sorted(files, key=sort_key)
+
+def file_label(filename):
+    #Same pretty label PhiPlotter has always used
+    label = os.path.basename(filename)
+    label = label.replace('Coated', 'Coating')
+    label = label.replace('Averaged Phi.txt', r'$\phi$')
+    return label
+
+def _image_name(text):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', text).strip('_')
+
+def _draw(ax, filename, Ans):
+    T, Phi, Std = ColumnLoader.load_columns(filename, 3)
+    if Ans == 'Q':
+        Q, Q_lower, Q_upper = PhiQConversion.q_interval(Phi, Std)
+        ax.errorbar(T, Q, [Q_lower, Q_upper], label=file_label(filename), linestyle='None', marker='o')
+        ax.set_ylabel("Q (unitless)", fontsize=14)
+    else:
+        ax.errorbar(T, Phi, Std, label=file_label(filename), linestyle='None', marker='o')
+        ax.set_ylabel(r"Loss Angle ($\phi$)", fontsize=14)
+
+def render_figure(job):
+    #Worker: draws one figure of one or more files and saves it, returns the image name
+    filenames, Ans, title, output_file = job
+    fig = Figure(figsize=(8, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    for filename in filenames:
+        _draw(ax, filename, Ans)
+    ax.set_yscale('log')
+    ax.set_xlabel("Temperature (K)", fontsize=14)
+    ax.set_title(title)
+    ax.grid()
+    ax.legend(fontsize='small')
+    fig.savefig(output_file, dpi=image_dpi)
+    return output_file
+
+def report_jobs(files, output_dir, answers=('Q', 'Phi')):
+    #One job per file and y axis, plus one combined job per folder and y axis. Image names
+    #follow the path below the folder all the files share, so the same mode file from two
+    #sample folders gets two different images (e.g. SampleA_Mode_1__390_Hz_Q.png)
+    folders = {}
+    for filename in files:
+        folders.setdefault(os.path.dirname(os.path.abspath(filename)), []).append(filename)
+    common = os.sep.join(os.path.commonprefix([folder.split(os.sep) for folder in folders]))
+    def relative(path):
+        path = os.path.relpath(path, common) if common else path
+        return os.path.basename(common) if path == '.' else path
+    jobs = []
+    for Ans in answers:
+        name = 'Q' if Ans == 'Q' else 'Loss Angle'
+        for filename in files:
+            jobs.append(([filename], Ans, file_label(filename) + ": " + name + " vs Temperature",
+                         os.path.join(output_dir, _image_name(relative(os.path.abspath(filename))) + '_' + Ans + '.png')))
+        for folder in sorted(folders):
+            jobs.append((folders[folder], Ans, os.path.basename(folder) + ": " + name + " vs Temperature",
+                         os.path.join(output_dir, _image_name(relative(folder)) + '_' + Ans + '.png')))
+    images = [job[3] for job in jobs]
+    if len(set(images)) != len(images):
+        raise ValueError('Two figures would be saved to the same image name, check for duplicate files')
+    return jobs
+
+def render_report(files, output_dir, answers=('Q', 'Phi'), processes=None):
+    #Renders every job in a process pool, returns the image file names
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    jobs = report_jobs(files, output_dir, answers)
+    pool = multiprocessing.Pool(processes)
+    try:
+        images = pool.map(render_figure, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return images
+
+def _parse_rows(text, n_columns):
+    #Complete lines of numbers as a (rows, n_columns) array, skipping blank lines, # comments
+    #and any line that isn't n_columns numbers
+    lines = [line for line in text.split(b'\n') if line.strip() != b'' and not line.lstrip().startswith(b'#')]
+    if len(lines) == 0:
+        return np.zeros((0, n_columns))
+    try:
+        values = np.fromstring(b' '.join(lines), dtype=float, sep=' ')
+    except ValueError:
+        values = np.zeros(0)
+    if len(values) == len(lines)*n_columns and len(b' '.join(lines).split()) == len(values):
+        return values.reshape(-1, n_columns)
+    rows = []
+    for line in lines:
+        try:
+            row = [float(x) for x in line.split()]
+        except ValueError:
+            continue
+        if len(row) >= n_columns:
+            rows.append(row[:n_columns])
+    return np.array(rows, dtype=float).reshape(-1, n_columns)
+
+class FileTail(object):
+    #Reads a growing text file a piece at a time, keeping the rows read so far in rows. A last
+    #line with no line end is held back until the file stops growing for one read, so a line
+    #caught half written is never used, but a finished file without a final newline still
+    #gives its last row.
+    def __init__(self, filename, n_columns=3):
+        self.filename = filename
+        self.n_columns = n_columns
+        self._start()
+
+    def _start(self):
+        self.offset = 0
+        self.carry = b''
+        self.rows = np.zeros((0, self.n_columns))
+        self.last = np.zeros((0, self.n_columns))
+
+    def data(self):
+        return np.concatenate([self.rows, self.last])
+
+    def read(self):
+        #Reads whatever was added since the last call, returns True if data() changed. A file
+        #that shrank was replaced, so it is read again from the start.
+        try:
+            size = os.path.getsize(self.filename)
+        except OSError:
+            return False
+        changed = False
+        if size < self.offset:
+            self._start()
+            changed = True
+        if size == self.offset:
+            if self.carry.strip() != b'' and len(self.last) == 0:
+                self.last = _parse_rows(self.carry, self.n_columns)
+                changed = changed or len(self.last) > 0
+            return changed
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        self.offset += len(chunk)
+        text = self.carry + chunk
+        cut = text.rfind(b'\n') + 1
+        text, self.carry = text[:cut], text[cut:]
+        rows = _parse_rows(text, self.n_columns)
+        changed = changed or len(rows) > 0 or len(self.last) > 0
+        self.last = np.zeros((0, self.n_columns))
+        if len(rows) > 0:
+            self.rows = np.concatenate([self.rows, rows])
+        return changed
+
+def _set_errorbar(container, x, y, low, high):
+    #Moves the points and vertical bars of an existing errorbar container
+    data_line, caplines, barlinecols = container.lines
+    data_line.set_data(x, y)
+    barlinecols[0].set_segments([[(a, b), (a, c)] for a, b, c in zip(x, low, high)])
+
+class LiveLossPlot(object):
+    #One errorbar per file matching path (a directory or glob pattern) on ax, Ans is Q or Phi
+    def __init__(self, path, Ans, ax):
+        self.path = path
+        self.Ans = Ans
+        self.ax = ax
+        self.tails = {}
+        self.artists = {}
+        self.last_draw = None
+        self.stale = False
+        ax.set_yscale('log')
+        ax.set_xlabel("Temperature (K)", fontsize=14)
+        ax.set_ylabel("Q (unitless)" if Ans == 'Q' else r"Loss Angle ($\phi$)", fontsize=14)
+        ax.grid()
+
+    def _update_artist(self, filename):
+        T, Phi, Std = self.tails[filename].data().T
+        if self.Ans == 'Q':
+            Y, lower, upper = PhiQConversion.q_interval(Phi, Std)
+            #Unbounded upper errors (Std >= Phi) only show the lower half of the bar
+            high = np.where(np.isfinite(upper), Y + upper, Y)
+        else:
+            Y, lower, high = Phi, Std, Phi + Std
+        _set_errorbar(self.artists[filename], T, Y, Y - lower, high)
+
+    def poll(self):
+        #Picks up new files and new lines, returns True if anything changed
+        changed = False
+        for filename in find_files(self.path):
+            if filename not in self.tails:
+                self.tails[filename] = FileTail(filename)
+                self.artists[filename] = self.ax.errorbar([], [], yerr=[], label=file_label(filename), linestyle='None', marker='o')
+                self.ax.legend(fontsize='small')
+            if self.tails[filename].read():
+                self._update_artist(filename)
+                changed = True
+        self.stale = self.stale or changed
+        return changed
+
+    def redraw(self, canvas, force=False):
+        #Redraws if something changed and the last redraw was long enough ago
+        now = time.time()
+        if not self.stale or (not force and self.last_draw is not None and now - self.last_draw < redraw_interval):
+            return False
+        self.ax.relim()
+        self.ax.autoscale_view()
+        canvas.draw_idle()
+        self.last_draw = now
+        self.stale = False
+        return True
+
+def watch(path, Ans):
+    #Interactive Watch mode, runs until the window is closed. pyplot is only imported here so
+    #the batch workers never touch a GUI backend
+    import matplotlib.pyplot as plt
+    plt.ion()
+    fig = plt.figure()
+    ax = fig.add_subplot(111)
+    live = LiveLossPlot(path, Ans, ax)
+    ax.set_title("Watching " + path)
+    live.poll()
+    live.redraw(fig.canvas, force=True)
+    while plt.fignum_exists(fig.number):
+        live.poll()
+        live.redraw(fig.canvas)
+        plt.pause(poll_interval)
@@ -1,71 +1,94 @@
+import os
+import sys
 import matplotlib.pyplot as plt
 
-#Ask the user how many text files they want to plot
-print("Please enter the total number of modes you wish to plot:")
-num_files = raw_input()
-num_files = int(num_files)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import PhiQConversion
+import ColumnLoader
+import PhiPlotTools
 
-#Ask the user for the names of each text file they want to plot
-i = 0
-files_list = {}
-while i < num_files-0.5:
-    print("Please enter the file name below, this message will repeat for each file:")
-    files_list[i] = raw_input()
-    i += 1
-i = 0
+if __name__ == '__main__':
+    #Batch mode renders in worker processes, they need this guard
+    #Ask the user whether to pick files one at a time, or plot a whole folder/pattern to images
+    print("Do you want to enter the files one at a time, plot every file in a directory or glob pattern to image files, or watch a directory and update the plot as data comes in? (Single/Batch/Watch):")
+    Run_ans = raw_input()
 
-#Import the data from each file into the lists of lists T and Q
-#T[0] and Q[0] are each lists holding T and Q from the first file and so on
-#We also need to convert the lists to floats, which is the additional loop
-T = {}
-Q = {}
-Phi = {}
-Std = {}
-while i < num_files-0.5:
-    with open(files_list[i]) as f:
-        lines = f.readlines()
-        T[i] = [line.split()[0] for line in lines]
-        Q[i] = [line.split()[1] for line in lines]
-        Phi[i] = [line.split()[1] for line in lines]
-        Std[i] = [line.split()[2] for line in lines]
-        j = 0
-        while j < len(T[i])-0.5:
-            T[i][j] = float(T[i][j])
-            Q[i][j] = 1/float(Q[i][j])
-            Phi[i][j] = float(Phi[i][j])
-            Std[i][j] = float(Std[i][j])
-            j += 1
-    i += 1
-i = 0
+    if Run_ans == 'Batch':
+        #Per mode and combined Q and Phi figures are saved as .png files, see PhiPlotTools.py
+        print("Please enter the directory or glob pattern of the files to plot (e.g. Mode *):")
+        path = raw_input()
+        print("Please enter the directory to save the figures in:")
+        output_dir = raw_input()
+        files = PhiPlotTools.find_files(path)
+        images = PhiPlotTools.render_report(files, output_dir)
+        print(str(len(images)) + " figures of " + str(len(files)) + " files saved in " + output_dir)
 
-#Ask the user if they want Q or Phi for their y-axis, and plot accordingly
-print("Do you want to have Q or Loss Angle on your y-axis? (Q/Phi):")
-Ans = raw_input()
+    elif Run_ans == 'Watch':
+        #New files and new lines are picked up every few seconds until the window is closed, see PhiPlotTools.py
+        print("Please enter the directory or glob pattern of the files to watch (e.g. Mode *):")
+        path = raw_input()
+        print("Do you want to have Q or Loss Angle on your y-axis? (Q/Phi):")
+        Ans = raw_input()
+        PhiPlotTools.watch(path, Ans)
 
-#Make the labels for the files pretty and plot the T and Q/Phi lists
-while i < num_files-0.5:
-    files_list[i] = files_list[i].replace('Coated', 'Coating')
-    files_list[i] = files_list[i].replace('Averaged Phi.txt', '$\phi$')
-    if Ans == 'Q':
-        plt.errorbar(T[i], Q[i], Std[i], label = files_list[i], linestyle='None', marker='o')
-        plt.title("4 Inch Diameter Si AlGaAs-coated: Q vs Temperature")
-        plt.ylabel("Q (unitless)")
-    if Ans == 'Phi':
-        #i = 0
-        #j = 0
-        #while i < num_files-0.5:
-        #    while j < len(T[i]) - 0.5:
-        #        Phi[i][j] = 1.0/Phi[i][j]
-        #        j += 1
-        #    j = 0
-        #    i += 1
-        plt.errorbar(T[i], Phi[i], Std[i], label = files_list[i], linestyle='None', marker='o',)
-        #plt.title("4 Inch Diameter Si AlGaAs-coated: Loss Angle $\phi$ vs Temperature")
-        plt.ylabel("Loss Angle ($\phi$)", fontsize=14)
-    i += 1
-ax = plt.gca()
-ax.set_yscale('log')
-plt.xlabel("Temperature (K)", fontsize=14)
-plt.grid()
-plt.legend()
-plt.show()
+    else:
+        #Ask the user how many text files they want to plot
+        print("Please enter the total number of modes you wish to plot:")
+        num_files = raw_input()
+        num_files = int(num_files)
+
+        #Ask the user for the names of each text file they want to plot
+        i = 0
+        files_list = {}
+        while i < num_files-0.5:
+            print("Please enter the file name below, this message will repeat for each file:")
+            files_list[i] = raw_input()
+            i += 1
+        i = 0
+
+        #Import the data from each file into the lists of arrays T and Phi
+        #T[0] and Phi[0] are each arrays holding T and Phi from the first file and so on
+        #Q and its (asymmetric) error bars come from PhiQConversion
+        T = {}
+        Q = {}
+        Q_err = {}
+        Phi = {}
+        Std = {}
+        while i < num_files-0.5:
+            T[i], Phi[i], Std[i] = ColumnLoader.load_columns(files_list[i], 3)
+            Q[i], Q_lower, Q_upper = PhiQConversion.q_interval(Phi[i], Std[i])
+            Q_err[i] = [Q_lower, Q_upper]
+            i += 1
+        i = 0
+
+        #Ask the user if they want Q or Phi for their y-axis, and plot accordingly
+        print("Do you want to have Q or Loss Angle on your y-axis? (Q/Phi):")
+        Ans = raw_input()
+
+        #Make the labels for the files pretty and plot the T and Q/Phi lists
+        while i < num_files-0.5:
+            files_list[i] = files_list[i].replace('Coated', 'Coating')
+            files_list[i] = files_list[i].replace('Averaged Phi.txt', '$\phi$')
+            if Ans == 'Q':
+                plt.errorbar(T[i], Q[i], Q_err[i], label = files_list[i], linestyle='None', marker='o')
+                plt.title("4 Inch Diameter Si AlGaAs-coated: Q vs Temperature")
+                plt.ylabel("Q (unitless)")
+            if Ans == 'Phi':
+                #i = 0
+                #j = 0
+                #while i < num_files-0.5:
+                #    while j < len(T[i]) - 0.5:
+                #        Phi[i][j] = 1.0/Phi[i][j]
+                #        j += 1
+                #    j = 0
+                #    i += 1
+                plt.errorbar(T[i], Phi[i], Std[i], label = files_list[i], linestyle='None', marker='o',)
+                #plt.title("4 Inch Diameter Si AlGaAs-coated: Loss Angle $\phi$ vs Temperature")
+                plt.ylabel("Loss Angle ($\phi$)", fontsize=14)
+            i += 1
+        ax = plt.gca()
+        ax.set_yscale('log')
+        plt.xlabel("Temperature (K)", fontsize=14)
+        plt.grid()
+        plt.legend()
+        plt.show()
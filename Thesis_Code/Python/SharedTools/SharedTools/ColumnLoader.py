@@ -0,0 +1,119 @@
+#Loader for the whitespace separated number files every script reads (temperature/loss/std,
+#frequency/dilution factor, etc.). Instead of readlines + split + float loops, the text is
+#parsed straight into a numpy array in blocks, one pass over the file.
+#
+#    data = ColumnLoader.load_table('Mode 1_ 390 Hz')            #(rows, columns) array
+#    T, Phi, Std = ColumnLoader.load_columns('Mode 1_ 390 Hz', 3) #First 3 columns as 1D arrays
+#
+#iter_table gives the same arrays a block at a time instead, for files too big to hold.
+#
+#The number of columns comes from the first line. Lines starting with # at the top of the
+#file are skipped. Anything the fast parser can't handle (comma separated columns, comments in
+#the middle) falls back to np.loadtxt, comma separated if the file has commas in it, so the
+#answer is the same either way. Ragged rows still raise ValueError.
+#
+#Big files (over cache_min_bytes) also get a binary copy saved next to them, a hidden
+#".<file name>.<size>_<mtime>.npy" file. The next load of an unchanged file memory maps that
+#copy instead of parsing the text again, which is close to instant even for millions of
+#rows. Editing or replacing the text file changes its size or modified time, so the old copy
+#is ignored and replaced. If the folder isn't writable the data just isn't cached.
+
+import os
+import numpy as np
+
+block_bytes = 16*(2**20) #Text parsed per block
+cache_min_bytes = 2**20 #Smaller files parse quickly enough not to bother caching
+
+def _cache_prefix(filename):
+    directory, name = os.path.split(os.path.abspath(filename))
+    return directory, '.' + name + '.'
+
+def _cache_name(filename):
+    st = os.stat(filename)
+    directory, prefix = _cache_prefix(filename)
+    return os.path.join(directory, prefix + str(st.st_size) + '_' + str(int(st.st_mtime*(10**6))) + '.npy')
+
+def _remove_stale(filename, keep):
+    directory, prefix = _cache_prefix(filename)
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(prefix) and name.endswith('.npy') and path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def iter_table(filename, block_bytes=block_bytes):
+    #Yields the file as (rows, columns) arrays of about block_bytes of text each, cut at line
+    #ends, so a file of any size can be worked through with constant memory
+    with open(filename, 'rb') as f:
+        n_columns = None
+        carry = b''
+        while True:
+            chunk = f.read(block_bytes)
+            text = carry + chunk
+            if chunk:
+                cut = text.rfind(b'\n') + 1
+                text, carry = text[:cut], text[cut:]
+            if n_columns is None:
+                lines = text.split(b'\n')
+                while lines and (lines[0].strip() == b'' or lines[0].lstrip().startswith(b'#')):
+                    lines.pop(0)
+                if lines:
+                    n_columns = len(lines[0].split())
+                    text = b'\n'.join(lines)
+            if n_columns is not None and text.strip() != b'':
+                values = np.fromstring(text, dtype=float, sep=' ')
+                #Older numpy stops quietly at a bad value instead of raising, so check the count.
+                #Counting lines is cheap, only blank lines make us count every value.
+                rows = text.count(b'\n') + (0 if text.endswith(b'\n') else 1)
+                if len(values) != rows*n_columns and len(values) != len(text.split()):
+                    raise ValueError('Not a plain table of numbers')
+                if len(values) % n_columns != 0:
+                    raise ValueError('Rows have different numbers of columns')
+                yield values.reshape(-1, n_columns)
+            if not chunk:
+                break
+
+def parse_text(filename):
+    #The whole file in one array
+    blocks = list(iter_table(filename))
+    if len(blocks) == 0:
+        return np.zeros((0, 0))
+    return np.concatenate(blocks)
+
+def load_table(filename, cache=True):
+    #All columns of filename as a (rows, columns) float array
+    cache_file = None
+    if cache and os.path.getsize(filename) >= cache_min_bytes:
+        cache_file = _cache_name(filename)
+        if os.path.exists(cache_file):
+            try:
+                return np.load(cache_file, mmap_mode='r')
+            except (IOError, OSError, ValueError):
+                pass
+    try:
+        data = parse_text(filename)
+    except ValueError:
+        with open(filename, 'rb') as f:
+            commas = b',' in f.read(block_bytes)
+        data = np.loadtxt(filename, delimiter=',' if commas else None, ndmin=2)
+    if cache_file is not None:
+        tmp_file = cache_file + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                np.save(f, data)
+            if os.path.exists(cache_file):
+                os.remove(cache_file)
+            os.rename(tmp_file, cache_file)
+            _remove_stale(filename, cache_file)
+        except (IOError, OSError):
+            pass
+    return data
+
+def load_columns(filename, n_columns, cache=True):
+    #The first n_columns columns as separate 1D arrays, e.g. T, Phi, Std = load_columns(name, 3)
+    data = load_table(filename, cache)
+    if data.shape[1] < n_columns:
+        raise ValueError(filename + ' has ' + str(data.shape[1]) + ' columns, expected at least ' + str(n_columns))
+    return tuple(data[:, k] for k in range(n_columns))
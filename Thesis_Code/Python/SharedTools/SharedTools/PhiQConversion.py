@@ -0,0 +1,92 @@
+#Loss angle <-> quality factor conversion and error propagation, shared by PhiCoatExtractor and
+#PhiPlotter. Everything works on whole numpy arrays, so a multi-mode data set can be stacked
+#into one array (or a 2D mode x temperature array) and converted in one call.
+#
+#Q = 1/Phi is not linear, so a symmetric error in Phi gives an asymmetric error in Q:
+#   Q lower error = 1/Phi - 1/(Phi + Std)
+#   Q upper error = 1/(Phi - Std) - 1/Phi     (inf if Std >= Phi, Q is unbounded above)
+#The linear (first order) error is Std/Phi^2, fine when Std << Phi.
+#
+#For the coating loss Phi_coat = (1/D)*Phi_tot + (1 - 1/D)*Phi_sub there are two options:
+#   coating_loss_linear      - first order propagation of the coated, substrate and dilution
+#                              factor errors, including the D term (Phi_tot - Phi_sub)/D^2
+#   coating_loss_monte_carlo - draws normal samples of Phi_tot, Phi_sub and D, returns the
+#                              median and a central interval of Phi_coat and Q_coat, so the
+#                              intervals come out asymmetric when the errors are large
+#The Monte Carlo runs in batches of points so the sample arrays stay a manageable size.
+
+import numpy as np
+
+one_sigma = 0.682689492137 #Central interval covered by +-1 standard deviation
+mc_points_per_batch = 10**7 #Rough number of (sample, point) values held at once
+
+def phi_to_q(Phi, Std):
+    #Returns Q and the linear standard deviation of Q
+    Phi = np.asarray(Phi, dtype=float)
+    Std = np.asarray(Std, dtype=float)
+    Q = 1/Phi
+    return Q, Std/(Phi**2)
+
+def q_to_phi(Q, StdQ):
+    #Same thing the other way, Phi = 1/Q
+    return phi_to_q(Q, StdQ)
+
+def q_interval(Phi, Std):
+    #Returns Q with its asymmetric lower and upper errors from Phi +- Std
+    Phi = np.asarray(Phi, dtype=float)
+    Std = np.asarray(Std, dtype=float)
+    Q = 1/Phi
+    lower = Q - 1/(Phi + Std)
+    with np.errstate(divide='ignore'):
+        upper = np.where(Phi > Std, 1/(Phi - Std) - Q, np.inf)
+    return Q, lower, upper
+
+def coating_loss_linear(Phi_tot, Std_tot, Phi_sub, Std_sub, D, Std_D=0.):
+    #First order propagation for Phi_coat = (1/D)*Phi_tot + (1 - 1/D)*Phi_sub
+    Phi_tot = np.asarray(Phi_tot, dtype=float)
+    Std_tot = np.asarray(Std_tot, dtype=float)
+    Phi_sub = np.asarray(Phi_sub, dtype=float)
+    Std_sub = np.asarray(Std_sub, dtype=float)
+    D = np.asarray(D, dtype=float)
+    a = 1/D
+    Phi_coat = a*Phi_tot + (1-a)*Phi_sub
+    var = (a*Std_tot)**2 + ((1-a)*Std_sub)**2 + (((Phi_tot - Phi_sub)/(D**2))*Std_D)**2
+    return Phi_coat, np.sqrt(var)
+
+def _percentiles(samples, interval):
+    #Median and central interval along axis 0, ignoring NaN samples
+    edges = [50*(1 - interval), 50., 50*(1 + interval)]
+    low, mid, high = np.nanpercentile(samples, edges, axis=0)
+    return mid, low, high
+
+def coating_loss_monte_carlo(Phi_tot, Std_tot, Phi_sub, Std_sub, D, Std_D=0., n_samples=4000, interval=one_sigma, seed=None):
+    #Inputs broadcast against each other (e.g. D per mode against a mode x temperature array).
+    #Returns a dictionary of arrays with the broadcast shape:
+    #   Phi, Phi_lower, Phi_upper  - median and interval ends of the coating loss
+    #   Q, Q_lower, Q_upper        - the same for the coating Q
+    #Samples with D <= 0 are dropped. Q percentiles are taken from the Q samples themselves,
+    #so they stay right when some Phi samples cross zero.
+    arrays = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (Phi_tot, Std_tot, Phi_sub, Std_sub, D, Std_D)])
+    shape = arrays[0].shape
+    Phi_tot, Std_tot, Phi_sub, Std_sub, D, Std_D = [x.ravel() for x in arrays]
+    n = len(Phi_tot)
+    rng = np.random.RandomState(seed)
+    names = ['Phi', 'Phi_lower', 'Phi_upper', 'Q', 'Q_lower', 'Q_upper']
+    result = dict((name, np.empty(n)) for name in names)
+    batch = max(1, mc_points_per_batch//n_samples)
+    for start in range(0, n, batch):
+        s = slice(start, min(start + batch, n))
+        m = s.stop - s.start
+        tot = Phi_tot[s] + Std_tot[s]*rng.standard_normal((n_samples, m))
+        sub = Phi_sub[s] + Std_sub[s]*rng.standard_normal((n_samples, m))
+        d = D[s] + Std_D[s]*rng.standard_normal((n_samples, m))
+        d[d <= 0] = np.nan
+        coat = tot/d + (1 - 1/d)*sub
+        with np.errstate(divide='ignore'):
+            Q = 1/coat
+        Q[~np.isfinite(Q)] = np.nan
+        result['Phi'][s], result['Phi_lower'][s], result['Phi_upper'][s] = _percentiles(coat, interval)
+        result['Q'][s], result['Q_lower'][s], result['Q_upper'][s] = _percentiles(Q, interval)
+    for name in names:
+        result[name] = result[name].reshape(shape)
+    return result
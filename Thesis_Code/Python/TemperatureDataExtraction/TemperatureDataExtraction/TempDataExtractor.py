@@ -1,80 +1,56 @@
 #This code takes as input the .csv or .txt files that the temperature controller spits out.
-#It converts that file to however many .txt files the user wants. The maximum is five.
-#Three for the three temperature probes, and two for the two heater powers.
-#Each file has the time on the first column and the user's desired quantity on the second column.
+#It pulls out as many channels as the user wants, picked by their name in the header line of
+#the log or by a pattern such as *Heat* (SampleFloor, Stage, PulseTube, SampleHeat and CH Heat
+#always work). Each channel is saved as TimeVsTemp<channel>.npy, a binary (rows, 2) array with
+#the time in the first column and the channel in the second, and optionally as a .txt file too.
+#The time can be kept as logged or converted to the time since the log started (ms, s, minutes,
+#hours) or to the date and time, as many of these as wanted in the same run.
+#The log is read once and every file is written in the same pass (see TempLogTools.py), so
+#multi-gigabyte logs work too.
 
-import numpy as np
+import TempLogTools
 
 #Ask the user what file they want to convert
 print("Please enter the .csv or .txt file you wish to convert:")
 primary_file = raw_input()
 
-#First chop off the top line that is just info about what each column is
-primary = open(primary_file, "r")
-lines = primary.readlines()
-primary.close()
-del lines[0]
-chopped = open('Chopped_Data.txt', "w+")
-for line in lines:
-    chopped.write(line)
-chopped.close()
+#Show the user what is in the log
+header = TempLogTools.read_header(primary_file)
+print("The log has these channels: " + ", ".join(header[1:]))
 
-#Now the data itself (delimited by commas) is held in the file called 'Chopped_Data.txt'
 #Next we ask the user which quantity or quantities they want to extract
-print("How many quantities do you wish to extract? (Maximum of 5)")
+print("How many channels or channel patterns do you wish to extract?")
 num_params = raw_input()
 num_params = int(num_params)
 
 #Now we ask which parameters they want to extract
-print("Which parameters do you want to extract? Type them one at a time.")
-print("SampleFloor, Stage, PulseTube, SampleHeat, and CH Heat are the five options")
+print("Which channels do you want to extract? Type them one at a time, a name from the header or a pattern like *Heat*.")
+print("SampleFloor, Stage, PulseTube, SampleHeat, and CH Heat also work as before")
+params = []
 i = 0
-params = [0]
 while i < num_params-0.5:
     params.append(raw_input())
     i += 1
 
-'''#Test Printing
-print('Here is what params looks like after it is taken in:')
-print(params)
-'''
-
-#Now 'params' is a list holding the names of the parameters we want.
-#Let's convert each parameter in that list to a column number.
-text_params = []
-for i in range(len(params)):
-    text_params.append(params[i])#Save the old params to text_params
-for i in range(len(params)):
-    if params[i] == 'SampleFloor':
-        params[i] = int(1)
-    if params[i] == 'Stage':
-        params[i] = int(2)
-    if params[i] == 'PulseTube':
-        params[i] = int(4)
-    if params[i] == 'SampleHeat':
-        params[i] = int(7)
-    if params[i] == 'CH Heat':
-        params[i] = int(12)
-
-#Test Printing
-#print('Here is what params looks like after it is converted to column number:')
-#print(params)
-
-#'params' now holds the column numbers of the desired quantities. Let's use those and chopped to make the .txt files.
-chopped = open('Chopped_Data.txt', "r")
-lines = chopped.readlines()
-i = 1
-j = 0
-while i < len(params)-0.5:
-    result = []
-    j = 0
-    while j < len(lines)-0.5:
-        result.append(lines[j].split(',')[0])
-        #print(i, params[i], j, lines[j])
-        result.append(lines[j].split(',')[params[i]] + '\n')
-        j += 1
-    txtfile = open("TimeVsTemp" + text_params[i] + ".txt","w")
-    for element in result:
-        txtfile.write(element + ' ')
-    txtfile.close
-    i += 1
+print("Do you want .txt files as well as the binary .npy files? (Y/N):")
+text_ans = raw_input()
+
+#The time can be converted on the way, each unit goes to its own file (like UnixConverter.py)
+print("Which times do you want? Enter any of raw (Unix ms as logged), milliseconds, seconds, minutes, hours, datetime (text only) separated by spaces, leave blank for raw:")
+units = raw_input().split()
+if units == []:
+    units = ['raw']
+
+#Convert each name or pattern to the channels and columns it matches
+channels, unmatched = TempLogTools.resolve_channels(header, params)
+for param in unmatched:
+    print(param + " doesn't match any channel in the log (case matters), skipping it.")
+
+#Pull every channel out of the log in one pass
+if channels:
+    n_rows, n_skipped = TempLogTools.extract_channels(primary_file, channels, text=(text_ans == 'Y'), units=units)
+    extensions = ['.npy', '.txt'] if text_ans == 'Y' else ['.npy']
+    names = [TempLogTools.output_name(name, '.', extension, unit) for name, column in channels for unit in units for extension in extensions if not (unit == 'datetime' and extension == '.npy')]
+    print(str(n_rows) + " rows written to each of " + ", ".join(names))
+    if n_skipped > 0:
+        print(str(n_skipped) + " blank or incomplete lines were skipped.")
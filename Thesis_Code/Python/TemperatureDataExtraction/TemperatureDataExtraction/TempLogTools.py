@@ -0,0 +1,413 @@
+#Streaming extraction of channels from the temperature controller (CTC) logs, used by
+#TempDataExtractor.py. The log is a comma separated file with one header line naming the
+#columns, the Unix time in ms in the first column and one column per channel. Instead of
+#copying the log without its header and splitting every line again for each channel, the log
+#is read once in blocks of block_bytes and every requested channel is written in the same pass.
+#Memory use doesn't depend on the size of the log.
+#
+#Channels are picked by their name in the header, or by a pattern (e.g. "*Heat*", matched with
+#fnmatch, so any number of channels). The old names SampleFloor, Stage, PulseTube, SampleHeat
+#and CH Heat still work, if the header doesn't have them they stand for their old columns.
+#
+#Each channel is written to TimeVsTemp<channel>.npy, a float64 (rows, 2) array of time and
+#value that np.load(name, mmap_mode='r') opens instantly whatever its size. The .npy header is
+#written with room to spare at the start and filled in with the row count at the end, so the
+#rows can be streamed straight to the file. TimeVsTemp<channel>.txt ("<time> <value>" lines,
+#both numbers copied exactly as they are in the log) is optional.
+#
+#The time can also be converted on the way through, to the time since the log started in any
+#of time_units, or (text only) to the absolute UTC date and time. Every unit asked for gets its
+#own TimeVsTemp<channel><unit> file from the same pass, the conversion is one numpy operation
+#per block. UnixConverter.py does the same for files that were already extracted.
+#
+#window_stats joins extracted channels to measurements (TempMeasurementJoin.py). For every
+#measurement window [start, end] it finds the rows inside with searchsorted and gives the
+#number of rows, mean, min, max and drift (least squares slope, per hour when the times are
+#in ms) of the channel. Every statistic is one numpy reduceat over the window edges, so a
+#million row log against thousands of windows takes a fraction of a second.
+#
+#PlateauDetector finds where a channel sat still (TempPlateauFinder.py). A row is stable when
+#the rows in the window before it (the last `window` of time) have a standard deviation within
+#tolerance and a straight line fit that drifts less than tolerance over the window. A plateau
+#is a run of stable rows, starting at the beginning of the first stable window, kept if it
+#lasts at least min_duration. The rolling sums are done a block at a time with numpy, carrying
+#only the last window of rows from one block to the next, so the memory used depends on the
+#window and not on the length of the log.
+
+import os
+import re
+import sys
+import fnmatch
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import ColumnLoader
+
+block_bytes = 16*(2**20) #Log text handled per block
+
+#Column of each channel in the CTC log
+legacy_columns = {'SampleFloor': 1, 'Stage': 2, 'PulseTube': 4, 'SampleHeat': 7, 'CH Heat': 12}
+
+#Milliseconds per unit, for time since the start of the log. 'raw' is the Unix time in ms as
+#logged and 'datetime' the UTC date and time.
+time_units = {'milliseconds': 1., 'seconds': 1000., 'minutes': 60000., 'hours': 3600000.,
+              'ms': 1., 's': 1000., 'min': 60000., 'h': 3600000.}
+
+npy_header_bytes = 128 #Fixed size of the .npy header, room for any row count
+block_rows = 2**18 #Rows of an extracted channel handled at a time by the plateau detector
+
+def read_header(filename):
+    #Column names from the first line of the log
+    with open(filename, 'rb') as f:
+        line = f.readline()
+    return [name.strip() for name in line.decode('utf-8', 'replace').split(',')]
+
+def resolve_channels(header, requests):
+    #Turns names or patterns into a list of (name, column) pairs, in the order asked for and
+    #without repeats. Time (column 0) is never matched by a pattern. Returns the pairs and the
+    #requests that matched nothing.
+    channels = []
+    unmatched = []
+    for request in requests:
+        if request in header[1:]:
+            found = [(request, header.index(request, 1))]
+        else:
+            found = [(header[k], k) for k in range(1, len(header)) if fnmatch.fnmatchcase(header[k], request)]
+            if not found and request in legacy_columns:
+                found = [(request, legacy_columns[request])]
+        if not found:
+            unmatched.append(request)
+        for channel in found:
+            if channel not in channels:
+                channels.append(channel)
+    return channels, unmatched
+
+def iter_line_blocks(filename, block_bytes=block_bytes):
+    #Yields the lines after the header line as lists of bytes, about block_bytes at a time,
+    #always cut at line ends
+    with open(filename, 'rb') as f:
+        f.readline()
+        carry = b''
+        while True:
+            chunk = f.read(block_bytes)
+            text = carry + chunk
+            if chunk:
+                cut = text.rfind(b'\n') + 1
+                text, carry = text[:cut], text[cut:]
+            lines = text.splitlines()
+            if lines:
+                yield lines
+            if not chunk:
+                break
+
+def _to_float(field):
+    try:
+        return float(field)
+    except ValueError:
+        return np.nan
+
+def parse_block(lines, n_fields, n_needed):
+    #Lines of a block as a (rows, n_fields) float array, dropping lines with fewer than
+    #n_needed fields. The whole block is parsed by numpy in one go, only a block with short,
+    #long or non numeric lines is done line by line (non numbers become NaN).
+    lines = [line for line in lines if line.strip() != b'']
+    try:
+        values = np.fromstring(b','.join(lines), dtype=float, sep=',')
+    except ValueError:
+        values = None
+    if values is not None and len(values) == len(lines)*n_fields and all(line.count(b',') == n_fields - 1 for line in lines):
+        return values.reshape(-1, n_fields)
+    table = []
+    for line in lines:
+        fields = line.split(b',')
+        if len(fields) >= n_needed:
+            table.append([_to_float(field) for field in fields[:n_fields]] + [np.nan]*(n_fields - len(fields)))
+    return np.array(table, dtype=float).reshape(-1, n_fields)
+
+class NpyColumnWriter(object):
+    #Writes a float64 (rows, n_columns) .npy file a block of rows at a time
+    def __init__(self, filename, n_columns=2):
+        self.n_columns = n_columns
+        self.n_rows = 0
+        self.f = open(filename, 'wb')
+        self.f.write(self._header())
+
+    def _header(self):
+        text = "{'descr': '<f8', 'fortran_order': False, 'shape': (" + str(self.n_rows) + ", " + str(self.n_columns) + "), }"
+        text = text + ' '*(npy_header_bytes - 10 - len(text) - 1) + '\n'
+        return b'\x93NUMPY\x01\x00' + np.array([len(text)], dtype='<u2').tobytes() + text.encode('latin1')
+
+    def write(self, rows):
+        rows = np.ascontiguousarray(rows, dtype='<f8')
+        self.f.write(rows.tobytes())
+        self.n_rows += len(rows)
+
+    def close(self):
+        #Fills in the final row count
+        self.f.seek(0)
+        self.f.write(self._header())
+        self.f.close()
+
+def normalize_time(time, unit, time_start):
+    #Unix times in ms as time since time_start in unit, as they are for 'raw', or as
+    #datetime64[ms] for 'datetime'
+    time = np.asarray(time, dtype=float)
+    if unit == 'raw':
+        return time
+    if unit == 'datetime':
+        return np.round(time).astype('int64').astype('datetime64[ms]')
+    if unit not in time_units:
+        raise ValueError(unit + ' is not a time unit, use one of ' + ', '.join(sorted(time_units)) + ', raw or datetime')
+    return (time - time_start)/time_units[unit]
+
+def format_time(values, unit):
+    #Normalized times as a list of text (bytes) for the .txt files
+    if unit == 'datetime':
+        strings = np.datetime_as_string(values)
+    else:
+        strings = np.char.mod('%.15g', values)
+    return [x.encode('ascii') for x in strings.tolist()]
+
+def _parse_times(rows):
+    times = b' '.join([row[0] for row in rows])
+    try:
+        values = np.fromstring(times, dtype=float, sep=' ')
+        if len(values) == len(rows):
+            return values
+    except ValueError:
+        pass
+    return np.array([_to_float(row[0]) for row in rows])
+
+def output_name(channel, output_dir='.', extension='.txt', unit='raw'):
+    #Characters that can't go in a file name are replaced with _. Converted times add the unit
+    #to the name, e.g. TimeVsTempStageminutes.txt like UnixConverter.py always has.
+    suffix = '' if unit == 'raw' else unit
+    return os.path.join(output_dir, 'TimeVsTemp' + re.sub(r'[\\/:*?"<>|]', '_', channel) + suffix + extension)
+
+def extract_channels(log_file, channels, output_dir='.', text=False, binary=True, units=('raw',), block_bytes=block_bytes):
+    #channels is a list of (name, column) pairs and units a list of 'raw', 'datetime' or
+    #time_units. Writes output_name(name, unit=unit) .npy and/or .txt files for each channel
+    #and unit (no .npy for datetime) and returns the number of rows written and the number of
+    #lines skipped (blank lines, or lines cut short, e.g. the last line of a log that is still
+    #being written). Times since the start count from the first row of the log.
+    if not (text or binary):
+        raise ValueError('Nothing to write, ask for text and/or binary output')
+    for unit in units:
+        normalize_time([0.], unit, 0.)
+    converting = any(unit != 'raw' for unit in units)
+    n_fields = len(read_header(log_file))
+    n_needed = max(column for name, column in channels) + 1
+    n_fields = max(n_fields, n_needed)
+    text_files = []
+    npy_files = []
+    try:
+        for name, column in channels:
+            for unit in units:
+                if text:
+                    text_files.append((open(output_name(name, output_dir, '.txt', unit), 'wb'), column, unit))
+                if binary and unit != 'datetime':
+                    npy_files.append((NpyColumnWriter(output_name(name, output_dir, '.npy', unit)), column, unit))
+        n_rows = 0
+        n_skipped = 0
+        time_start = None
+        for lines in iter_line_blocks(log_file, block_bytes):
+            if binary:
+                table = parse_block(lines, n_fields, n_needed)
+                times = table[:, 0]
+            if text:
+                rows = [line.split(b',') for line in lines]
+                complete = [row for row in rows if len(row) >= n_needed]
+                if not binary and converting:
+                    times = _parse_times(complete)
+            n_written = len(complete) if text else len(table)
+            n_skipped += len(lines) - n_written
+            n_rows += n_written
+            if n_written == 0:
+                continue
+            if time_start is None and converting:
+                time_start = times[0]
+            for writer, column, unit in npy_files:
+                writer.write(np.column_stack([normalize_time(times, unit, time_start), table[:, column]]))
+            for f, column, unit in text_files:
+                if unit == 'raw':
+                    time_text = [row[0].strip() for row in complete]
+                else:
+                    time_text = format_time(normalize_time(times, unit, time_start), unit)
+                f.write(b'\n'.join([t + b' ' + row[column].strip() for t, row in zip(time_text, complete)]) + b'\n')
+    finally:
+        for f, column, unit in text_files:
+            f.close()
+        for writer, column, unit in npy_files:
+            writer.close()
+    return n_rows, n_skipped
+
+def load_channel(filename):
+    #Time and value columns of an extracted channel, .npy (memory mapped) or text, sorted by time
+    if filename.endswith('.npy'):
+        data = np.load(filename, mmap_mode='r')
+        time, value = data[:, 0], data[:, 1]
+    else:
+        time, value = ColumnLoader.load_columns(filename, 2)
+    if np.any(np.diff(time) < 0):
+        order = np.argsort(time, kind='mergesort')
+        time, value = time[order], value[order]
+    return time, value
+
+def _running_sum(x):
+    return np.concatenate([[0.], np.cumsum(x)])
+
+def window_stats(time, value, starts, ends, time_per_hour=3600000.):
+    #time sorted, starts and ends the measurement windows in the same time base (inclusive).
+    #Returns a dictionary of arrays over the windows: n, mean, min, max and drift (slope of a
+    #straight line fit in value per hour, time_per_hour is the time units in an hour). NaN values
+    #are left out, windows with no rows give NaN.
+    time = np.asarray(time, dtype=float)
+    value = np.asarray(value, dtype=float)
+    starts = np.asarray(starts, dtype=float)
+    ends = np.asarray(ends, dtype=float)
+    first = np.searchsorted(time, starts, side='left')
+    last = np.maximum(first, np.searchsorted(time, ends, side='right'))
+
+    #Every sum, min and max is one reduceat over the window edges, with the windows sorted by
+    #start so the stretches between windows add up to at most one pass over the log. The extra
+    #element at the end lets a window run to the last row. Sums only add within a window (unlike
+    #running sums over the whole log), so the slope doesn't lose precision on long logs.
+    order = np.argsort(first, kind='mergesort')
+    edges = np.column_stack([first[order], last[order]]).ravel()
+    empty = first == last
+    def reduce_windows(ufunc, x, pad):
+        result = np.empty(len(first))
+        if len(first) > 0:
+            result[order] = ufunc.reduceat(np.append(x, pad), edges)[::2]
+        result[empty] = pad
+        return result
+
+    #Time and value relative to the first row, NaN values count as nothing
+    good = np.isfinite(value)
+    v0 = value[good][0] if np.any(good) else 0.
+    t = np.where(good, (time - time[0])/time_per_hour, 0.) if len(time) > 0 else time
+    v = np.where(good, value - v0, 0.)
+    n = reduce_windows(np.add, good.astype(float), 0.)
+    S_t = reduce_windows(np.add, t, 0.)
+    S_v = reduce_windows(np.add, v, 0.)
+    S_tt = reduce_windows(np.add, t*t, 0.)
+    S_tv = reduce_windows(np.add, t*v, 0.)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(n > 0, S_v/n + v0, np.nan)
+        drift = np.where(n > 1, (n*S_tv - S_t*S_v)/(n*S_tt - S_t**2), np.nan)
+    low = reduce_windows(np.fmin, value, np.nan)
+    high = reduce_windows(np.fmax, value, np.nan)
+    return {'n': n.astype(int), 'mean': mean, 'min': low, 'max': high, 'drift': drift}
+
+def iter_channel(filename, block_rows=block_rows):
+    #Time and value of an extracted channel (.npy or text) a block of rows at a time
+    if filename.endswith('.npy'):
+        data = np.load(filename, mmap_mode='r')
+        for start in range(0, len(data), block_rows):
+            block = np.array(data[start:start + block_rows])
+            yield block[:, 0], block[:, 1]
+    else:
+        for block in ColumnLoader.iter_table(filename):
+            yield block[:, 0], block[:, 1]
+
+class PlateauDetector(object):
+    #Feed it time sorted blocks of a channel with feed(), then call finish(). Both return the
+    #plateaus that have ended, each a tuple of (start, end, mean, std, rows). window, tolerance
+    #and min_duration are in the units of the time and value columns.
+    def __init__(self, window, tolerance, min_duration, min_rows=3):
+        self.window = window
+        self.tolerance = tolerance
+        self.min_duration = min_duration
+        self.min_rows = min_rows
+        self.time_first = None
+        self.carry_time = np.zeros(0)
+        self.carry_value = np.zeros(0)
+        self.open = None #Running plateau: start, end, rows, sum and sum of squares about ref, ref
+
+    def _close(self, found):
+        start, end, n, S_v, S_vv, ref = self.open
+        self.open = None
+        if end - start >= self.min_duration:
+            mean = S_v/n
+            found.append((start, end, mean + ref, np.sqrt(max(S_vv/n - mean**2, 0.)), int(n)))
+
+    def feed(self, time, value):
+        time = np.asarray(time, dtype=float)
+        value = np.asarray(value, dtype=float)
+        good = np.isfinite(time) & np.isfinite(value)
+        time, value = time[good], value[good]
+        found = []
+        if len(time) == 0:
+            return found
+        if self.time_first is None:
+            self.time_first = time[0]
+        tb = np.concatenate([self.carry_time, time])
+        vb = np.concatenate([self.carry_value, value])
+        n_carry = len(self.carry_time)
+        t = tb - tb[0]
+        v = vb - vb[0]
+        C_t = _running_sum(t)
+        C_v = _running_sum(v)
+        C_tt = _running_sum(t*t)
+        C_tv = _running_sum(t*v)
+        C_vv = _running_sum(v*v)
+
+        #Rolling statistics of the window ending at each new row
+        rows = np.arange(n_carry, len(tb))
+        first = np.searchsorted(tb, tb[rows] - self.window, side='left')
+        n = (rows + 1 - first).astype(float)
+        S_t = C_t[rows + 1] - C_t[first]
+        S_v = C_v[rows + 1] - C_v[first]
+        S_tt = C_tt[rows + 1] - C_tt[first]
+        S_tv = C_tv[rows + 1] - C_tv[first]
+        S_vv = C_vv[rows + 1] - C_vv[first]
+        var = np.maximum(S_vv/n - (S_v/n)**2, 0.)
+        denom = n*S_tt - S_t**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(denom > 0, (n*S_tv - S_t*S_v)/np.where(denom > 0, denom, 1.), 0.)
+        stable = ((tb[rows] - self.window >= self.time_first) & (n >= self.min_rows) &
+                  (np.sqrt(var) <= self.tolerance) & (np.abs(slope)*self.window <= self.tolerance))
+
+        #Runs of stable rows, [run_start, run_end) in new rows
+        steps = np.diff(np.concatenate([[0], stable.astype(int), [0]]))
+        run_starts = np.flatnonzero(steps == 1)
+        run_ends = np.flatnonzero(steps == -1)
+        if self.open is not None and not (len(run_starts) > 0 and run_starts[0] == 0):
+            self._close(found)
+        #Plateau rows in the buffer, from the start of the first stable window (or the start of
+        #this block for a plateau carried on from the last one) to the last stable row. Their
+        #sums are taken about the plateau's first value, straight from the rows, so the std
+        #keeps its precision however far the log has moved since the start of the block.
+        for k in range(len(run_starts)):
+            last = run_ends[k] + n_carry
+            if k == 0 and self.open is not None:
+                start, end, n_open, S_v_open, S_vv_open, ref_open = self.open
+                d = vb[n_carry:last] - ref_open
+                self.open = (start, tb[last - 1], n_open + len(d), S_v_open + d.sum(), S_vv_open + (d*d).sum(), ref_open)
+            else:
+                plateau_first = first[run_starts[k]]
+                d = vb[plateau_first:last] - vb[plateau_first]
+                self.open = (tb[plateau_first], tb[last - 1], len(d), d.sum(), (d*d).sum(), vb[plateau_first])
+            if run_ends[k] < len(rows):
+                self._close(found)
+
+        #Keep the last window of rows for the windows of the next block
+        keep = np.searchsorted(tb, tb[-1] - self.window, side='left')
+        self.carry_time = tb[keep:]
+        self.carry_value = vb[keep:]
+        return found
+
+    def finish(self):
+        found = []
+        if self.open is not None:
+            self._close(found)
+        return found
+
+def find_plateaus(filename, window, tolerance, min_duration, block_rows=block_rows):
+    #Every plateau of an extracted channel file, see PlateauDetector
+    detector = PlateauDetector(window, tolerance, min_duration)
+    found = []
+    for time, value in iter_channel(filename, block_rows):
+        found.extend(detector.feed(time, value))
+    found.extend(detector.finish())
+    return found
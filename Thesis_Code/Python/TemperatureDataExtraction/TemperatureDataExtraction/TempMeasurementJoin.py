@@ -0,0 +1,64 @@
+#This script links the temperature logs to the loss measurements. It takes channel files made by
+#TempDataExtractor.py (TimeVsTemp<channel>.npy or .txt) and a file with the start and end time of
+#each measurement (ringdown), one measurement per line. For every measurement and channel it
+#writes the number of log rows in the window and the mean, min, max and drift (change per hour
+#from a straight line fit) of the channel, so the temperature of a measurement is read from the
+#log instead of typed in by hand. The join is done by TempLogTools.window_stats.
+
+import os
+import sys
+import glob
+import TempLogTools
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import ColumnLoader
+
+#Ask the user for the channel files
+print("Please enter the channel files to join, a file name or a glob pattern like TimeVsTemp*.npy:")
+channel_pattern = raw_input()
+channel_files = sorted(glob.glob(channel_pattern))
+print("Found " + str(len(channel_files)) + " channel files: " + ", ".join(channel_files))
+
+#Ask the user for the measurement windows
+print("Please enter the measurement file, with the start and end time of each measurement in the first two columns:")
+measurement_file = raw_input()
+starts, ends = ColumnLoader.load_columns(measurement_file, 2)
+
+#The drift is per hour, so we need to know what the times are in
+print("What unit are the times in? The extracted files are in Unix milliseconds unless they were converted. (milliseconds, seconds, minutes, hours, leave blank for milliseconds):")
+time_unit = raw_input()
+if time_unit == '':
+    time_unit = 'milliseconds'
+while time_unit not in TempLogTools.time_units:
+    print("Please enter one of " + ", ".join(sorted(TempLogTools.time_units)) + ":")
+    time_unit = raw_input()
+time_per_hour = TempLogTools.time_units['hours']/TempLogTools.time_units[time_unit]
+
+print("Please enter the file name to write the joined table to:")
+output_file = raw_input()
+
+#Work out the statistics of every channel over every window
+names = []
+stats = []
+for filename in channel_files:
+    name = os.path.basename(filename)
+    name = name.replace('TimeVsTemp', '').replace('.npy', '').replace('.txt', '').replace(' ', '_')
+    time, value = TempLogTools.load_channel(filename)
+    names.append(name)
+    stats.append(TempLogTools.window_stats(time, value, starts, ends, time_per_hour))
+
+#One line per measurement, the columns of each channel one after another
+with open(output_file, 'w') as f:
+    header = '#Start End'
+    for name in names:
+        header = header + ' ' + name + '_n ' + name + '_mean ' + name + '_min ' + name + '_max ' + name + '_drift(/h)'
+    f.write(header + '\n')
+    for k in range(len(starts)):
+        line = str(float(starts[k])) + ' ' + str(float(ends[k]))
+        for stat in stats:
+            line = line + ' ' + str(stat['n'][k]) + ' ' + str(float(stat['mean'][k])) + ' ' + str(float(stat['min'][k])) + ' ' + str(float(stat['max'][k])) + ' ' + str(float(stat['drift'][k]))
+        f.write(line + '\n')
+print(str(len(starts)) + " measurements joined to " + str(len(names)) + " channels, written to " + output_file)
+empty = sum([int((stat['n'] == 0).sum()) for stat in stats])
+if empty > 0:
+    print(str(empty) + " measurement/channel pairs had no log rows in the window (check the time units), they are nan.")
@@ -0,0 +1,38 @@
+#This script finds the temperature plateaus in the channel files made by TempDataExtractor.py
+#(TimeVsTemp<channel>.npy or .txt), instead of eyeballing the plots. A plateau is a stretch where
+#the channel stayed within a tolerance (small standard deviation and small drift over a sliding
+#window) for at least a minimum time. For each channel it writes the start, end, mean and
+#standard deviation of every plateau. The log is read a block at a time (TempLogTools.py), so
+#multi-day logs at high rates work with little memory.
+
+import os
+import glob
+import TempLogTools
+
+#Ask the user for the channel files
+print("Please enter the channel files to search, a file name or a glob pattern like TimeVsTemp*.npy:")
+channel_pattern = raw_input()
+channel_files = sorted(glob.glob(channel_pattern))
+print("Found " + str(len(channel_files)) + " channel files: " + ", ".join(channel_files))
+
+#Everything is in the units of the files, Unix milliseconds unless they were converted
+print("Please enter the length of the sliding window, in the time units of the files (e.g. 600000 for 10 minutes in ms):")
+window = float(raw_input())
+print("Please enter the tolerance, how far the channel may wander within a window (e.g. 0.01 for 10 mK):")
+tolerance = float(raw_input())
+print("Please enter the shortest plateau to keep, in the time units of the files:")
+min_duration = float(raw_input())
+print("Please enter the file name to write the plateau table to:")
+output_file = raw_input()
+
+#One line per plateau, grouped by channel
+with open(output_file, 'w') as f:
+    f.write('#Channel Start End Duration Mean Std Rows\n')
+    for filename in channel_files:
+        name = os.path.basename(filename)
+        name = name.replace('TimeVsTemp', '').replace('.npy', '').replace('.txt', '').replace(' ', '_')
+        plateaus = TempLogTools.find_plateaus(filename, window, tolerance, min_duration)
+        for start, end, mean, std, rows in plateaus:
+            f.write(name + ' ' + str(float(start)) + ' ' + str(float(end)) + ' ' + str(float(end - start)) + ' ' + str(float(mean)) + ' ' + str(float(std)) + ' ' + str(rows) + '\n')
+        print(name + ": " + str(len(plateaus)) + " plateaus")
+print("Plateau table written to " + output_file)
@@ -1,67 +1,47 @@
 #This script is built to convert the Unix time the CTC outputs to time since turning on the data recording.
-#The user selects how they want the time displayed (milliseconds, seconds, minutes, or hours)
+#The user selects how they want the time displayed (milliseconds, seconds, minutes, or hours), or
+#several of these at once, or the date and time (UTC). Each one is written to its own file.
+#It reads the TimeVsTemp<channel>.txt or .npy files from TempDataExtractor.py. TempDataExtractor can
+#also do this conversion itself while extracting, without going through the files again.
 
+import os
+import sys
 import numpy as np
+import TempLogTools
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import ColumnLoader
 
 #Ask the user which time file to convert
 print("Please enter the temperature time file you wish to convert:")
 filename = raw_input()
-time, T = np.loadtxt(filename, usecols=[0,1], unpack=True)
-print("Enter unit of time you want to convert to (milliseconds, seconds, minutes, or hours):")
-time_unit = raw_input()
-filenamefix = filename.replace('.txt', '')
-output_string = filenamefix + time_unit + '.txt'
-
-#Do the converting (depending on how the user wants it converted)
-i = 0
-j = 0
+if filename.endswith('.npy'):
+    data = np.load(filename, mmap_mode='r')
+    time, T = data[:, 0], data[:, 1]
+else:
+    time, T = ColumnLoader.load_columns(filename, 2)
+print("Enter the units of time you want to convert to, separated by spaces (milliseconds, seconds, minutes, hours, or datetime):")
+units = raw_input().split()
+
+#Do the converting for every unit the user asked for, in one numpy operation each
 confirm = 0
 time_start = time[0]
-
-if time_unit == 'milliseconds':
+for time_unit in units:
+    if time_unit != 'datetime' and time_unit not in TempLogTools.time_units:
+        print(time_unit + " is not a valid unit of time, case matters, skipping it.")
+        continue
     confirm = 1
-    while i < len(time)-0.5:
-        time[i] = time[i] - time_start
-        i += 1
-    with open(output_string, 'w') as f:
-        for j in range(len(time)):
-            f.write(str(time[j]) + " " + str(T[j]) + "\n")
-        f.close()
-
-if time_unit == 'seconds':
-    confirm = 1
-    while i < len(time)-0.5:
-        time[i] = time[i] - time_start
-        time[i] = time[i]/1000#ms to s conversion
-        i += 1
-    with open(output_string, 'w') as f:
-        for j in range(len(time)):
-            f.write(str(time[j]) + " " + str(T[j]) + "\n")
-        f.close()
-
-if time_unit == 'minutes':
-    confirm = 1
-    while i < len(time)-0.5:
-        time[i] = time[i] - time_start
-        time[i] = time[i]/60000#ms to minutes conversion
-        i += 1
-    with open(output_string, 'w') as f:
-        for j in range(len(time)):
-            f.write(str(time[j]) + " " + str(T[j]) + "\n")
-        f.close()
-
-if time_unit == 'hours':
-    confirm = 1
-    while i < len(time)-0.5:
-        time[i] = time[i] - time_start
-        time[i] = time[i]/3600000#ms to hours conversion
-        i += 1
-    with open(output_string, 'w') as f:
-        for j in range(len(time)):
-            f.write(str(time[j]) + " " + str(T[j]) + "\n")
-        f.close()
+    new_time = TempLogTools.normalize_time(time, time_unit, time_start)
+    filenamefix = filename.replace('.txt', '').replace('.npy', '')
+    if filename.endswith('.npy') and time_unit != 'datetime':
+        output_string = filenamefix + time_unit + '.npy'
+        np.save(output_string, np.column_stack([new_time, T]))
+    else:
+        output_string = filenamefix + time_unit + '.txt'
+        with open(output_string, 'wb') as f:
+            T_text = np.char.mod('%.15g', T).tolist()
+            f.write(b'\n'.join([t + b' ' + x.encode('ascii') for t, x in zip(TempLogTools.format_time(new_time, time_unit), T_text)]) + b'\n')
+    print("Written to " + output_string)
 
 if confirm == 0:
     print("Please rerun the code and enter a valid unit of time, case matters.")
-
-
@@ -0,0 +1,156 @@
+#This script searches for the coating and substrate design with the lowest thermoelastic loss,
+#following the idea of Zhou, Molina-Ruiz, Hellman, "Strategies to Reduce the Thermoelastic
+#Loss of Multimaterial Coated Finite Substrates". It uses the same model as TELossGenerator
+#(through TEModel.py) but varies the geometry instead of holding it at our AlGaAs stack:
+#   layer count       - total number of layers, alternating GaAs/AlGaAs with GaAs on both
+#                       ends like ours (23 layers = 12 GaAs + 11 AlGaAs). GaAs on both ends
+#                       needs an odd count, even counts are refused.
+#   layer thickness   - thickness of each layer, so coat_L = layer count * layer thickness
+#   substrate (sub_L) - thickness of the silicon substrate
+#Every combination of the values you enter is a candidate design. Each design is scored by
+#the total loss phi_tot averaged over the temperatures and mode frequencies you pick (the
+#band-integrated loss), and the designs are written out ranked from lowest to highest loss.
+#
+#Designs are evaluated in batches: the design parameters are arrays over the batch that
+#broadcast against the temperatures and frequencies, so one batch is one numpy evaluation.
+#The batches are spread over a process pool.
+#
+#The frequencies have to lie inside the dilution factor table (388 - 6400 Hz for our test
+#data), outside it there is no substrate loss and every design would score NaN, so such a band
+#is refused.
+#
+#Note that the mode frequencies and substrate dilution factors are held fixed while sub_L
+#changes. In reality both shift with thickness, so treat very different substrates with care.
+#
+#Also note that 23 layers of 266 nm is 6.12 um, while TEModel (and TELossGenerator) use the
+#measured coat_L of 6.28 um for our stack. The 23 layer, 266 nm design is therefore not quite
+#our sample, enter 273 nm layers to match the 6.28 um total.
+#
+#Lists can be typed out (11 23 35) or given as start:stop:number for evenly spaced values
+#(100:400:7 gives 100, 150, ... 400).
+
+import itertools
+import multiprocessing
+import numpy as np
+import TEModel
+
+layer_l_default = 266*(10**-9) #m, our layer thickness
+points_per_batch = 10**6 #Rough number of (design, T, f) points evaluated per batch
+
+def parse_layer_counts(text):
+    #Layer counts as ints, refusing anything that isn't an odd whole number of layers
+    n_layers = TEModel.parse_values(text)
+    for n in n_layers:
+        if n != round(n) or n < 1 or int(round(n)) % 2 == 0:
+            raise ValueError('Layer counts must be odd (GaAs on both ends), got ' + str(n))
+    return [int(round(n)) for n in n_layers]
+
+def design_params(n_layers, layer_l, sub_L):
+    #Geometry parameters for TEModel, arrays over designs shaped to broadcast against
+    #(T, f) arrays of shape (1, NT, NF). n_layers must be odd, (n + 1)/2 GaAs layers and
+    #(n - 1)/2 AlGaAs layers.
+    n_layers = np.asarray(n_layers, dtype=float)[:, np.newaxis, np.newaxis]
+    layer_l = np.asarray(layer_l, dtype=float)[:, np.newaxis, np.newaxis]
+    sub_L = np.asarray(sub_L, dtype=float)[:, np.newaxis, np.newaxis]
+    if np.any(n_layers % 2 != 1):
+        raise ValueError('Layer counts must be odd (GaAs on both ends)')
+    n_gaas = (n_layers + 1)/2
+    n_algaas = n_layers - n_gaas
+    return {
+        'coat_L': n_layers*layer_l,
+        'coat1_L': n_algaas*layer_l,
+        'coat2_L': n_gaas*layer_l,
+        'sub_L': sub_L,
+    }
+
+def band_in_table(f, mode_freq):
+    #True if every frequency is inside the dilution factor table
+    f = np.asarray(f, dtype=float)
+    return bool(np.all((f >= np.min(mode_freq)) & (f <= np.max(mode_freq))))
+
+_worker_model = None
+
+def _init_worker(dilution_file):
+    #Each worker builds its own model (splines and dilution table) once
+    global _worker_model
+    _worker_model = TEModel.TEModel(dilution_file)
+
+def evaluate_batch(job):
+    #Score a batch of designs, returns (mean phi_tot, max phi_tot) per design
+    designs, T, f = job
+    model = _worker_model
+    T = np.asarray(T, dtype=float)[np.newaxis, :, np.newaxis]
+    f = np.asarray(f, dtype=float)[np.newaxis, np.newaxis, :]
+    p = model.properties(T)
+    p.update(design_params(designs[:, 0], designs[:, 1], designs[:, 2]))
+    D = model.dilution(f)
+    phi_tot = TEModel.interface_loss(T, f, p) + TEModel.substrate_loss(T, f, D, p) + TEModel.coating_loss(T, f, p)
+    phi_tot = phi_tot.reshape(len(designs), -1)
+    return np.mean(phi_tot, axis=1), np.max(phi_tot, axis=1)
+
+def rank_designs(designs, T, f, dilution_file, processes=None):
+    #designs is an (M, 3) array of n_layers, layer_l (m), sub_L (m)
+    mode_freq, D_fact = TEModel.load_dilution_table(dilution_file)
+    if not band_in_table(f, mode_freq):
+        raise ValueError('Frequencies must be inside the dilution factor table, ' + str(np.min(mode_freq)) + ' to ' + str(np.max(mode_freq)) + ' Hz')
+    batch_size = max(1, points_per_batch//(len(T)*len(f)))
+    jobs = [(designs[k:k+batch_size], T, f) for k in range(0, len(designs), batch_size)]
+    pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(dilution_file,))
+    try:
+        results = pool.map(evaluate_batch, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    mean_phi = np.concatenate([r[0] for r in results])
+    max_phi = np.concatenate([r[1] for r in results])
+    #NaN scores go to the bottom
+    order = np.argsort(np.where(np.isfinite(mean_phi), mean_phi, np.inf), kind='mergesort')
+    return order, mean_phi, max_phi
+
+
+if __name__ == '__main__':
+    print("Please enter the dilution factor file for the substrate mode family (leave blank for the AlGaAs test data):")
+    dilution_file = raw_input()
+    if dilution_file == '':
+        dilution_file = TEModel.default_dilution_file
+    mode_freq, D_fact = TEModel.load_dilution_table(dilution_file)
+
+    print("Enter the temperatures (K) to minimize the loss over, e.g. 12 20 50 122 or 12:300:25:")
+    T_band = TEModel.parse_values(raw_input())
+    print("Enter the mode frequencies (Hz) to minimize the loss over (leave blank for all modes in the dilution file):")
+    freq_text = raw_input()
+    f_band = TEModel.parse_values(freq_text) if freq_text.strip() != '' else list(mode_freq)
+    while not band_in_table(f_band, mode_freq):
+        print("The substrate loss is only known between " + str(np.min(mode_freq)) + " and " + str(np.max(mode_freq)) + " Hz, the dilution factor table's range. Please enter mode frequencies inside it:")
+        f_band = TEModel.parse_values(raw_input())
+
+    print("Enter the layer counts to try, odd counts only, e.g. 11 23 35 47:")
+    n_layers_list = None
+    while n_layers_list is None:
+        try:
+            n_layers_list = parse_layer_counts(raw_input())
+        except ValueError:
+            print("Layer counts have to be odd so the stack has GaAs on both ends. Please enter the layer counts again:")
+    print("Enter the layer thicknesses to try in nm (leave blank for our 266 nm):")
+    layer_text = raw_input()
+    layer_l_list = [l*(10**-9) for l in TEModel.parse_values(layer_text)] if layer_text.strip() != '' else [layer_l_default]
+    print("Enter the substrate thicknesses to try in mm (leave blank for our 0.5 mm):")
+    sub_text = raw_input()
+    sub_L_list = [L*(10**-3) for L in TEModel.parse_values(sub_text)] if sub_text.strip() != '' else [TEModel.default_params['sub_L']]
+
+    designs = np.array(list(itertools.product(n_layers_list, layer_l_list, sub_L_list)), dtype=float)
+    print('Evaluating ' + str(len(designs)) + ' designs at ' + str(len(T_band)) + ' temperatures and ' + str(len(f_band)) + ' frequencies...')
+    order, mean_phi, max_phi = rank_designs(designs, T_band, f_band, dilution_file)
+
+    print("Please enter the file name for the ranked table of designs:")
+    output_file = raw_input()
+    with open(output_file, 'w') as f:
+        f.write('#Rank Layers LayerThickness(nm) CoatThickness(um) SubThickness(mm) MeanPhiTot MaxPhiTot\n')
+        for rank, k in enumerate(order):
+            n_layers, layer_l, sub_L = designs[k]
+            f.write(str(rank + 1) + ' ' + str(int(n_layers)) + ' ' + str(layer_l*(10**9)) + ' ' + str(n_layers*layer_l*(10**6)) + ' ' + str(sub_L*(10**3)) + ' ' + str(mean_phi[k]) + ' ' + str(max_phi[k]) + '\n')
+
+    print('Best designs (lowest band-averaged phi_tot):')
+    for rank, k in enumerate(order[:10]):
+        n_layers, layer_l, sub_L = designs[k]
+        print(str(rank + 1) + '. ' + str(int(n_layers)) + ' layers of ' + str(round(layer_l*(10**9), 1)) + ' nm on ' + str(round(sub_L*(10**3), 3)) + ' mm Si: mean phi_tot = ' + str(mean_phi[k]))
@@ -0,0 +1,25 @@
+#This script renders a loss surface saved by TELossGenerator (or any other result directory
+#written with TEResultStore) to a heatmap image file. The surface is read lazily, only
+#the rows that end up on a pixel are loaded, so very large surfaces can be viewed too.
+
+import TEPlotTools
+import TEResultStore
+
+print("Please enter the result directory holding the surface:")
+result_dir = raw_input()
+res = TEResultStore.open_results(result_dir)
+
+#Only offer the 2D arrays, those are the surfaces
+surfaces = [name for name in res.names() if res[name].ndim == 2]
+print("Which surface do you want to render? Options are: " + ', '.join(surfaces))
+component = raw_input()
+
+print("Please enter the image file name to write (.png or .svg):")
+image_file = raw_input()
+
+print("Enter loss angles to draw iso-loss contours at, separated by spaces (leave blank for none):")
+contour_levels = [float(level) for level in raw_input().split()]
+
+title_str = 'Modeled Thermoelastic Loss (' + component + ')'
+TEPlotTools.heatmap_from_results(result_dir, component, image_file, contours=contour_levels, title=title_str)
+print('Heatmap written to ' + image_file)
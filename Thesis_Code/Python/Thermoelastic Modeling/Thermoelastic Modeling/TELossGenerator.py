@@ -1,3 +1,5 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.interpolate import interp1d
@@ -5,6 +7,12 @@ from mpl_toolkits.mplot3d import Axes3D
 from matplotlib import cm
 import matplotlib.ticker as mticker
 from matplotlib.ticker import LinearLocator
+import TEResultStore
+import TEPlotTools
+import TENoisePSD
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import ColumnLoader
 #This code generates the loss angle or spectral density for the Thermoelastic loss of a coated substrate.
 #It initially uses the Zhou model to calculate loss from the interface, then the Cagnoli model to
 #calculate loss from the bulk substrate. Bulk coating loss is considered negligible due to its miniscule
@@ -285,12 +293,80 @@ def coth(x): #Cuts down on some of the math, numpy doesn't seem to have coth
     result = 1/np.tanh(x)
     return result
 
+def finish_run(arrays, axis_names, attrs, T, f):
+    #Saves the axes and loss components of a run to the result directory entered
+    #at the start (see TEResultStore.py for the format and how to read it back).
+    #In PSD mode it also turns the same loss arrays into thermal noise spectral
+    #densities (see TENoisePSD.py), saves those too and plots them in their own figure.
+    #axis_names lists the axis arrays the loss components are defined on, T and f are
+    #the temperature and frequency the loss components broadcast against.
+    components = {}
+    for name in arrays:
+        if name not in axis_names:
+            components[name] = arrays[name]
+    if output_ans == 'PSD':
+        psds = TENoisePSD.thermal_noise_psd(f, T, components, sub_E, sub_sig, beam_r0, sub_L)
+        arrays = dict(arrays)
+        arrays.update(psds)
+        components.update(psds)
+    if save_dir != '':
+        axes = {}
+        for name in components:
+            axes[name] = axis_names
+        TEResultStore.save_results(save_dir, arrays, axes=axes, attrs=attrs)
+        print('Saved ' + ', '.join(sorted(arrays.keys())) + ' to ' + save_dir)
+    if output_ans == 'PSD':
+        plot_psd(arrays, axis_names, psds)
+
+def plot_psd(arrays, axis_names, psds):
+    #Curves get their own figure (shown along with the loss plot), surfaces get a heatmap
+    psd_labels = {'psd_tot': 'Total', 'psd_sub': 'Substrate', 'psd_coat': 'Coating', 'psd_int': 'Interface'}
+    psd_title = 'Thermoelastic Displacement Noise of AlGaAs Coated Silicon Substrate'
+    if len(axis_names) == 1:
+        plt.figure()
+        x = arrays[axis_names[0]]
+        x_scale = 'linear' if axis_names[0] == 'Temper' else 'log'
+        for name in ['psd_tot', 'psd_sub', 'psd_coat', 'psd_int']:
+            if name in psds:
+                TEPlotTools.decimated_plot(plt.gca(), x, psds[name], x_scale, 'log', label=psd_labels[name])
+        plt.title(psd_title)
+        plt.xlabel('Temperature (K)' if axis_names[0] == 'Temper' else 'Frequency (Hz)')
+        plt.ylabel('Displacement PSD $S_x$ (m$^2$/Hz)')
+        plt.grid()
+        plt.legend()
+        #Start a fresh figure so the loss angle plot doesn't land on this one
+        plt.figure()
+        return
+    surface = psds['psd_tot'] if 'psd_tot' in psds else psds['psd_int']
+    if plot_ans == 'Heatmap':
+        root, ext = os.path.splitext(heatmap_file)
+        TEPlotTools.loss_heatmap(arrays['freq'], arrays['Temper'], surface, root + '_PSD' + ext, title=psd_title, cbar_label='Displacement PSD log($S_x$/(m$^2$/Hz))')
+        print('PSD heatmap written to ' + root + '_PSD' + ext)
+    else:
+        fig = plt.figure()
+        TEPlotTools.draw_heatmap(fig, fig.add_subplot(111), arrays['freq'], arrays['Temper'], surface, title=psd_title, cbar_label='Displacement PSD log($S_x$/(m$^2$/Hz))')
+
 #Ask the user if they want a single temperature slice (and vary frequency)
 #or if they want a single frequency slice (and vary temperature)
 #or if they want to vary both (plot a surface instead of a line)
 print("What variable will you hold constant? (Temp, Freq, None):")
 Type = raw_input()
 
+#Ask where to save the arrays we compute so they can be reused without rerunning
+print("Enter a directory name to save the computed arrays to (leave blank to skip saving):")
+save_dir = raw_input()
+
+#The loss angles can also be turned into thermal noise spectral densities (see TENoisePSD.py)
+print("Do you want the loss angle only, or the thermal noise displacement spectral density as well? (Phi/PSD):")
+output_ans = raw_input()
+if output_ans == 'PSD':
+    print("Please enter the beam radius in m (radius where the intensity falls to 1/e, e.g. 0.0001):")
+    beam_r0 = float(raw_input())
+    #The PSD formula assumes the substrate is thick compared to the beam (see TENoisePSD.py)
+    while not TENoisePSD.beam_fits(beam_r0, sub_L):
+        print("The PSD formula only holds for beam radii up to " + str(TENoisePSD.max_beam_fraction*sub_L) + " m on this " + str(sub_L) + " m thick substrate. Please enter a smaller beam radius in m:")
+        beam_r0 = float(raw_input())
+
 if Type == 'Temp':
     print("What temperature do you want to model interface thermoelastic loss for? Enter an integer please:")
     const_temp = raw_input()
@@ -418,15 +494,7 @@ if Type == 'Temp':
         #in the first column and dilution factor in the second.
         print('Please enter the data file containing the mode frequencies and dilution factors for a single mode family (1st column = frequency, 2nd column = dilution factor):')
         mode_file = raw_input()
-        with open(mode_file) as f:
-            lines = f.readlines()
-            mode_freq = [line.split()[0] for line in lines]
-            D_fact = [line.split()[1] for line in lines]
-        i = 0
-        while i < len(mode_freq)-0.5:
-            mode_freq[i] = float(mode_freq[i])
-            D_fact[i] = float(D_fact[i])
-            i += 1
+        mode_freq, D_fact = ColumnLoader.load_columns(mode_file, 2)
         #Below is where the interpolation happens for the dilution factors
         f_D_fact = interp1d(mode_freq, D_fact, kind='cubic')
         D_fact_freq = np.linspace(mode_freq[0], mode_freq[len(mode_freq)-1], num=ndata)
@@ -491,9 +559,10 @@ if Type == 'Temp':
 
         #And add the substrate loss to the interface loss
         phi_tot = phi_int_interp + phi_sub
+        finish_run({'D_fact_freq': D_fact_freq, 'phi_int': phi_int_interp, 'phi_sub': phi_sub, 'phi_tot': phi_tot}, ['D_fact_freq'], {'Type': Type, 'const_temp': const_temp}, const_temp, D_fact_freq)
 
         #Plot it
-        plt.plot(D_fact_freq, phi_tot)
+        TEPlotTools.decimated_plot(plt.gca(), D_fact_freq, phi_tot, 'log', 'log')
         #12 K loss of coated sample mode 1 plotted below
         if const_temp == 12.0:
             plt.scatter(390, 6.78*(10**-8))
@@ -529,15 +598,7 @@ if Type == 'Temp':
         #in the first column and dilution factor in the second.
         print('Please enter the data file containing the mode frequencies and dilution factors for a single mode family (1st column = frequency, 2nd column = dilution factor):')
         mode_file = raw_input()
-        with open(mode_file) as f:
-            lines = f.readlines()
-            mode_freq = [line.split()[0] for line in lines]
-            D_fact = [line.split()[1] for line in lines]
-        i = 0
-        while i < len(mode_freq)-0.5:
-            mode_freq[i] = float(mode_freq[i])
-            D_fact[i] = float(D_fact[i])
-            i += 1
+        mode_freq, D_fact = ColumnLoader.load_columns(mode_file, 2)
         #Below is where the interpolation happens for the dilution factors
         f_D_fact = interp1d(mode_freq, D_fact, kind='cubic')
         D_fact_freq = np.linspace(mode_freq[0], mode_freq[len(mode_freq)-1], num=ndata)
@@ -633,12 +694,13 @@ if Type == 'Temp':
         #And add the substrate loss and coating loss to the interface loss
         #phi_tot = phi_int_interp + phi_coat
         phi_tot = phi_int_interp + phi_sub + phi_coat
+        finish_run({'D_fact_freq': D_fact_freq, 'phi_int': phi_int_interp, 'phi_sub': phi_sub, 'phi_coat': phi_coat, 'phi_tot': phi_tot}, ['D_fact_freq'], {'Type': Type, 'const_temp': const_temp}, const_temp, D_fact_freq)
 
         #Plot it
-        plt.plot(D_fact_freq, phi_tot, label='Total')
-        plt.plot(D_fact_freq, phi_sub, label='Substrate')
-        plt.plot(D_fact_freq, phi_coat, label='Coating')
-        plt.plot(D_fact_freq, phi_int_interp, label='Interface')
+        TEPlotTools.decimated_plot(plt.gca(), D_fact_freq, phi_tot, 'log', 'log', label='Total')
+        TEPlotTools.decimated_plot(plt.gca(), D_fact_freq, phi_sub, 'log', 'log', label='Substrate')
+        TEPlotTools.decimated_plot(plt.gca(), D_fact_freq, phi_coat, 'log', 'log', label='Coating')
+        TEPlotTools.decimated_plot(plt.gca(), D_fact_freq, phi_int_interp, 'log', 'log', label='Interface')
         #12 K loss of coated sample mode 1 plotted below
         if const_temp == 12.0:
             plt.scatter(390, 6.78*(10**-8))
@@ -659,8 +721,9 @@ if Type == 'Temp':
         plt.show()
 
     if substrate_loss_ans != 'Y' and coating_loss_ans != 'Y':
+        finish_run({'freq': freq, 'phi_int': phi_int}, ['freq'], {'Type': Type, 'const_temp': const_temp}, const_temp, freq)
         title_str = 'AlGaAs Coated Thin Disk Resonator Thermoelastic Loss from Interface at ' + str(const_temp) + ' K'
-        plt.plot(freq, phi_int)
+        TEPlotTools.decimated_plot(plt.gca(), freq, phi_int, 'log', 'log')
         #12 K loss of coated sample mode 1 plotted below
         if const_temp == 12.0:
             plt.scatter(390, 6.78*(10**-8))
@@ -782,15 +845,7 @@ if Type == 'Freq':
         #Start by importing the dilution factor data.
         print('Please enter the data file containing the mode frequencies and dilution factors for a single mode family (1st column = frequency, 2nd column = dilution factor):')
         mode_file = raw_input()
-        with open(mode_file) as f:
-            lines = f.readlines()
-            mode_freq = [line.split()[0] for line in lines]
-            D_fact = [line.split()[1] for line in lines]
-        i = 0
-        while i < len(mode_freq)-0.5:
-            mode_freq[i] = float(mode_freq[i])
-            D_fact[i] = float(D_fact[i])
-            i += 1
+        mode_freq, D_fact = ColumnLoader.load_columns(mode_file, 2)
         #Below is where the interpolation happens for the dilution factors
         f_D_fact = interp1d(mode_freq, D_fact, kind='cubic')
         D_fact_freq = np.linspace(mode_freq[0], mode_freq[len(mode_freq)-1], num=ndata)
@@ -816,6 +871,7 @@ if Type == 'Freq':
         
         #Add the substrate and interface losses
         phi_tot = phi_int + phi_sub
+        finish_run({'Temper': Temper, 'phi_int': phi_int, 'phi_sub': phi_sub, 'phi_tot': phi_tot}, ['Temper'], {'Type': Type, 'const_freq': const_freq, 'D_fact_const': D_fact_const}, Temper, const_freq)
 
         #Import data and overlay if the user wants
         print('Do you want to import data to overlay as well? (Y/N):')
@@ -823,27 +879,13 @@ if Type == 'Freq':
         if Ans == 'Y':
             print('Please enter the text file that holds your data (Column 1 = Temperature, Column 2 = Loss, Column 3 = Error):')
             data_file = raw_input()
-            T_Meas = {}
-            Phi_Meas = {}
-            StD_Meas = {}
-            with open(data_file) as f:
-                lines = f.readlines()
-                T_Meas = [line.split()[0] for line in lines]
-                Phi_Meas = [line.split()[1] for line in lines]
-                StD_Meas = [line.split()[2] for line in lines]
-            #Convert them to floats
-            i = 0
-            while i < len(T_Meas)-0.5:
-                T_Meas[i] = float(T_Meas[i])
-                Phi_Meas[i] = float(Phi_Meas[i])
-                StD_Meas[i] = float(StD_Meas[i])
-                i += 1
+            T_Meas, Phi_Meas, StD_Meas = ColumnLoader.load_columns(data_file, 3)
             plt.errorbar(T_Meas, Phi_Meas, StD_Meas, label='Measured Total Loss', linestyle='None', marker='o', color='red')
 
         #Plot the total loss
-        plt.plot(Temper, phi_int, label='Modeled loss of interface', color='orange')
-        plt.plot(Temper, phi_sub, label='Modeled loss of substrate', color='green')
-        plt.plot(Temper, phi_tot, label='Modeled loss of substrate plus interface', color = 'blue')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_int, 'linear', 'log', label='Modeled loss of interface', color='orange')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_sub, 'linear', 'log', label='Modeled loss of substrate', color='green')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_tot, 'linear', 'log', label='Modeled loss of substrate plus interface', color = 'blue')
         ax = plt.gca()
         ax.set_yscale('log')
         #ax.set_xscale('log')
@@ -872,15 +914,7 @@ if Type == 'Freq':
         if mode_fam_ans == 'Y':
             print('Please enter the data file containing the mode frequencies and dilution factors for a single mode family (1st column = frequency, 2nd column = dilution factor):')
             mode_file = raw_input()
-            with open(mode_file) as f:
-                lines = f.readlines()
-                mode_freq = [line.split()[0] for line in lines]
-                D_fact = [line.split()[1] for line in lines]
-            i = 0
-            while i < len(mode_freq)-0.5:
-                mode_freq[i] = float(mode_freq[i])
-                D_fact[i] = float(D_fact[i])
-                i += 1
+            mode_freq, D_fact = ColumnLoader.load_columns(mode_file, 2)
             #Below is where the interpolation happens for the dilution factors
             f_D_fact = interp1d(mode_freq, D_fact, kind='cubic')
             D_fact_freq = np.linspace(mode_freq[0], mode_freq[len(mode_freq)-1], num=ndata)
@@ -943,6 +977,7 @@ if Type == 'Freq':
         
         #Add the substrate and interface losses and coating losses
         phi_tot = phi_sub + phi_int + phi_coat 
+        finish_run({'Temper': Temper, 'phi_int': phi_int, 'phi_sub': phi_sub, 'phi_coat': phi_coat, 'phi_tot': phi_tot}, ['Temper'], {'Type': Type, 'const_freq': const_freq, 'D_fact_const': D_fact_const}, Temper, const_freq)
 
         #Import data and overlay if the user wants
         print('Do you want to import data to overlay as well? (Y/N):')
@@ -950,28 +985,14 @@ if Type == 'Freq':
         if Ans == 'Y':
             print('Please enter the text file that holds your data (Column 1 = Temperature, Column 2 = Loss, Column 3 = Error):')
             data_file = raw_input()
-            T_Meas = {}
-            Phi_Meas = {}
-            StD_Meas = {}
-            with open(data_file) as f:
-                lines = f.readlines()
-                T_Meas = [line.split()[0] for line in lines]
-                Phi_Meas = [line.split()[1] for line in lines]
-                StD_Meas = [line.split()[2] for line in lines]
-            #Convert them to floats
-            i = 0
-            while i < len(T_Meas)-0.5:
-                T_Meas[i] = float(T_Meas[i])
-                Phi_Meas[i] = float(Phi_Meas[i])
-                StD_Meas[i] = float(StD_Meas[i])
-                i += 1
+            T_Meas, Phi_Meas, StD_Meas = ColumnLoader.load_columns(data_file, 3)
             plt.errorbar(T_Meas, Phi_Meas, StD_Meas, label='Measured Total Loss', linestyle='None', marker='o', color='red')
 
         #Plot the total loss
-        plt.plot(Temper, phi_int, label='Modeled thermoelastic loss of interface', color='orange')
-        plt.plot(Temper, phi_sub, label='Modeled thermoelastic loss of substrate', color='green')
-        plt.plot(Temper, phi_coat, label='Modeled thermoelastic loss of coating', color = 'purple')
-        plt.plot(Temper, phi_tot, label='Total modeled thermoelastic loss', color = 'blue')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_int, 'linear', 'log', label='Modeled thermoelastic loss of interface', color='orange')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_sub, 'linear', 'log', label='Modeled thermoelastic loss of substrate', color='green')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_coat, 'linear', 'log', label='Modeled thermoelastic loss of coating', color = 'purple')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_tot, 'linear', 'log', label='Total modeled thermoelastic loss', color = 'blue')
         ax = plt.gca()
         ax.set_yscale('log')
         #ax.set_xscale('log')
@@ -984,31 +1005,19 @@ if Type == 'Freq':
 
 
     if substrate_loss_ans != 'Y' and coating_loss_ans != 'Y':
+        finish_run({'Temper': Temper, 'phi_int': phi_int}, ['Temper'], {'Type': Type, 'const_freq': const_freq}, Temper, const_freq)
+
         #Let's import data and overlay it as well (if the user wants)
         print('Do you want to import data to overlay as well? (Y/N):')
         Ans = raw_input()
         if Ans == 'Y':
             print('Please enter the text file that holds your data (Column 1 = Temperature, Column 2 = Loss, Column 3 = Error):')
             data_file = raw_input()
-            T_Meas = {}
-            Phi_Meas = {}
-            StD_Meas = {}
-            with open(data_file) as f:
-                lines = f.readlines()
-                T_Meas = [line.split()[0] for line in lines]
-                Phi_Meas = [line.split()[1] for line in lines]
-                StD_Meas = [line.split()[2] for line in lines]
-            #Convert them to floats
-            i = 0
-            while i < len(T_Meas)-0.5:
-                T_Meas[i] = float(T_Meas[i])
-                Phi_Meas[i] = float(Phi_Meas[i])
-                StD_Meas[i] = float(StD_Meas[i])
-                i += 1
+            T_Meas, Phi_Meas, StD_Meas = ColumnLoader.load_columns(data_file, 3)
             plt.errorbar(T_Meas, Phi_Meas, StD_Meas, label='Measured Total Loss', linestyle='None', marker='o', color='red')
 
         title_str = 'AlGaAs Coated Thin Disk Resonator Thermoelastic Loss from Interface at ' + str(const_freq) + ' Hz'
-        plt.plot(Temper, phi_int, label='Modeled Loss Due to Interface')
+        TEPlotTools.decimated_plot(plt.gca(), Temper, phi_int, 'linear', 'log', label='Modeled Loss Due to Interface')
         ax = plt.gca()
         ax.set_yscale('log')
         #ax.set_xscale('log')
@@ -1039,15 +1048,7 @@ if Type == 'None':
         #in the first column and dilution factor in the second.
         print('Please enter the data file containing the mode frequencies and dilution factors for a single mode family (1st column = frequency, 2nd column = dilution factor):')
         mode_file = raw_input()
-        with open(mode_file) as f:
-            lines = f.readlines()
-            mode_freq = [line.split()[0] for line in lines]
-            D_fact = [line.split()[1] for line in lines]
-        i = 0
-        while i < len(mode_freq)-0.5:
-            mode_freq[i] = float(mode_freq[i])
-            D_fact[i] = float(D_fact[i])
-            i += 1
+        mode_freq, D_fact = ColumnLoader.load_columns(mode_file, 2)
         #Below is where the interpolation happens for the dilution factors
         f_D_fact = interp1d(mode_freq, D_fact, kind='cubic')
         D_fact_freq = np.linspace(mode_freq[0], mode_freq[len(mode_freq)-1], num=ndata)
@@ -1193,6 +1194,16 @@ if Type == 'None':
 
         j += 1
     
+    #The 3D surface is slow to draw past about 1000x1000 points, so offer a flat
+    #heatmap written straight to an image file as well (see TEPlotTools.py).
+    print('Do you want a 3D surface plot or a heatmap image file? (Surface/Heatmap):')
+    plot_ans = raw_input()
+    if plot_ans == 'Heatmap':
+        print('Please enter the image file name to write (.png or .svg):')
+        heatmap_file = raw_input()
+        print('Enter loss angles to draw iso-loss contours at, separated by spaces (leave blank for none):')
+        contour_levels = [float(level) for level in raw_input().split()]
+
     #Do the whole song and dance for substrate from above but
     #with temperature and frequency varying.
     
@@ -1221,12 +1232,17 @@ if Type == 'None':
                 phi_tot[j][i] = phi_sub[j][i] + phi_int[j][i]
                 i += 1
             j += 1
+        finish_run({'freq': freq, 'Temper': Temper, 'phi_int': phi_int, 'phi_sub': phi_sub, 'phi_tot': phi_tot}, ['Temper', 'freq'], {'Type': Type}, Temper[:, np.newaxis], freq[np.newaxis, :])
 
         #Ok, now let's plot our 3D surfaces generated.
         #These are phi_int_interp, phi_sub, and phi_tot.
         #I'm going to comment out the two smaller surfaces
         #since I don't have any experience plotting multiple
         #surfaces. A fun exercise for the reader!
+        if plot_ans == 'Heatmap':
+            TEPlotTools.loss_heatmap(freq, Temper, phi_tot, heatmap_file, title='Modeled Thermoelastic Loss for AlGaAs Coated Silicon Substrate', contours=contour_levels)
+            print('Heatmap written to ' + heatmap_file)
+    if substrate_loss_ans == 'Y' and plot_ans != 'Heatmap':
         fig, ax = plt.subplots(subplot_kw={'projection': '3d'})
         X, Y = np.meshgrid(freq, Temper)
         surf = ax.plot_surface(X, Y, np.log10(phi_tot), cmap=cm.coolwarm, edgecolor='none', linewidth=0, antialiased=False)
@@ -1242,6 +1258,11 @@ if Type == 'None':
 
     #And if the user does not want to model substrate loss...
     if substrate_loss_ans != 'Y':
+        finish_run({'freq': freq, 'Temper': Temper, 'phi_int': phi_int}, ['Temper', 'freq'], {'Type': Type}, Temper[:, np.newaxis], freq[np.newaxis, :])
+        if plot_ans == 'Heatmap':
+            TEPlotTools.loss_heatmap(freq, Temper, phi_int, heatmap_file, title='Modeled Thermoelastic Loss from Interface for AlGaAs Coated Silicon Substrate', contours=contour_levels)
+            print('Heatmap written to ' + heatmap_file)
+    if substrate_loss_ans != 'Y' and plot_ans != 'Heatmap':
         fig, ax = plt.subplots(subplot_kw={'projection': '3d'})
         X, Y = np.meshgrid(freq, Temper)
         surf = ax.plot_surface(X, Y, np.log10(phi_int), cmap=cm.coolwarm, edgecolor='none', linewidth=0, antialiased=False)
@@ -0,0 +1,54 @@
+#This script compares the thermoelastic loss of a whole catalog of substrate/coating
+#configurations at once, instead of copying TELossGenerator and editing its globals for
+#each one. The catalog is a json file holding a list of configurations, each one only
+#listing what it changes from our AlGaAs on 0.5 mm Si defaults (see MaterialSet in
+#TEModel.py for the keys you can use, and ExampleMaterialCatalog.json for an example).
+#
+#All configurations are computed together as one (configuration, temperature, frequency)
+#array, then plotted as phi_tot against frequency at each temperature you ask for.
+
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+import TEModel
+import TEPlotTools
+import TEResultStore
+
+print("Please enter the material catalog file (leave blank for ExampleMaterialCatalog.json):")
+catalog_file = raw_input()
+if catalog_file == '':
+    catalog_file = os.path.join(TEModel.here, 'ExampleMaterialCatalog.json')
+materials = TEModel.MaterialSet(TEModel.load_catalog(catalog_file))
+
+print("Enter the temperatures (K) to compare at, e.g. 12 122 300:")
+Temper = np.array(TEModel.parse_values(raw_input()))
+
+#The substrate loss needs dilution factors, so stay between the first and last mode
+mode_freq, D_fact = TEModel.load_dilution_table(TEModel.default_dilution_file)
+ndata = 2000
+freq = np.logspace(np.log10(mode_freq[0]), np.log10(mode_freq[-1]), num=ndata)
+
+#One broadcast over every configuration, temperature and frequency
+losses = materials.evaluate_all(Temper[:, np.newaxis], freq[np.newaxis, :])
+
+print("Enter a directory name to save the (configuration, temperature, frequency) arrays to (leave blank to skip saving):")
+save_dir = raw_input()
+if save_dir != '':
+    arrays = {'freq': freq, 'Temper': Temper}
+    axes = {}
+    for name in losses:
+        arrays[name] = losses[name]
+        axes[name] = ['config', 'Temper', 'freq']
+    TEResultStore.save_results(save_dir, arrays, axes=axes, attrs={'configs': materials.configs, 'catalog_file': catalog_file})
+    print('Saved to ' + save_dir)
+
+for k in range(len(materials)):
+    for j in range(len(Temper)):
+        label = materials.names[k] + ', ' + str(Temper[j]) + ' K'
+        TEPlotTools.decimated_plot(plt.gca(), freq, losses['phi_tot'][k, j], 'log', 'log', label=label)
+plt.title('Total Thermoelastic Loss by Configuration')
+plt.xlabel('Frequency (Hz)')
+plt.ylabel('Loss Angle $\phi_{TED}$')
+plt.grid()
+plt.legend(fontsize=8)
+plt.show()
@@ -0,0 +1,306 @@
+#Vectorized version of the thermoelastic loss model in TELossGenerator.py, for use from other
+#scripts (the model server, the residual and fitting tools) without going through prompts.
+#It uses the same material tables and the same expressions as TELossGenerator:
+#   interface loss   - Zhou, Molina-Ruiz, Hellman (phi_int)
+#   substrate loss   - Cagnoli et al 2017 with the mode family dilution factors (phi_sub)
+#   coating loss     - Fejer's effective medium expression for the multilayer (phi_coat)
+#The temperatures and frequencies can be arrays of any shape, they are broadcast against
+#each other, so the same call gives a single point, a curve or a full (T, f) surface.
+#
+#Building a TEModel does all the slow setup once (the cubic splines for the material
+#parameters and the dilution factor interpolation), after which evaluate() is pure numpy.
+#Example:
+#    model = TEModel()
+#    model.evaluate('phi_tot', 45., 8100.)
+#    model.evaluate('phi_int', Temper[:, np.newaxis], freq[np.newaxis, :]) #Surface
+
+import os
+import sys
+import numpy as np
+from scipy.interpolate import interp1d
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(here, '..', '..', 'SharedTools', 'SharedTools'))
+import ColumnLoader
+
+default_dilution_file = os.path.join(here, 'Didio_AlGaAs_TestData', 'ModeFamily1DFact.txt')
+
+#Temperatures the material tables are given at (same as TELossGenerator)
+T0 = np.array([12, 20, 50, 100, 122, 200, 300])
+T0_kap = np.array([12, 20, 50, 100, 122, 150, 175, 200, 250, 300])
+T0_coat_cv = np.array([12, 20, 30, 40, 50, 100, 122, 200, 300])
+T0_sub_cv = np.array([12, 20, 50, 100, 122, 200, 250, 300])
+
+#Silicon substrate, see TELossGenerator for sources
+sub_al = np.array([0.13, -0.27, -45., -33., -5., 140., 260.])*(10**-8) #1/K
+sub_kap = np.array([1800, 3000, 2600, 950, 620, 420, 325, 266, 195, 156]) #W/(m-K)
+sub_cv = np.array([1.45, 1.6, 2.5, 7.5, 10, 17, 19, 20.24])/0.028 #J/(kg-K)
+
+#AlGaAs-GaAs coating. TELossGenerator fills coat2_al with the AlGaAs values and uses the
+#stack values of conductivity and specific heat for both materials, kept the same here
+#so both give the same answers.
+coat_al = np.array([-1.0*(10**-9), -1.0*(10**-8), -0.13*(10**-6), 0.8*(10**-6), 1.4*(10**-6), 3.65*(10**-6), 5.0*(10**-6)]) #1/K
+coat_kap = np.array([350, 250, 75, 25, 20, 18.1, 16.4, 15, 12.5, 10]) #W/(m-K)
+coat_cv = 1000*np.array([0.027, 0.051, 0.074, 0.097, 0.12, 0.21, 0.25, 0.39, 0.57]) #J/(kg-K)
+coat2_al = coat_al
+
+#Temperature nodes and values of every temperature dependent parameter
+table_nodes = {
+    'sub_al': (T0, sub_al),
+    'sub_cv': (T0_sub_cv, sub_cv),
+    'sub_kap': (T0_kap, sub_kap),
+    'coat_al': (T0, coat_al),
+    'coat_cv': (T0_coat_cv, coat_cv),
+    'coat_kap': (T0_kap, coat_kap),
+    'coat2_al': (T0, coat2_al),
+}
+
+#Temperature independent parameters and geometry
+default_params = {
+    'sub_K': 95*(10**9), #Pa, bulk modulus
+    'sub_E': 169*(10**9), #Pa, Young's modulus
+    'sub_sig': 0.28, #Poisson ratio
+    'sub_L': .0005, #m, substrate thickness
+    'coat_E': 8.36*(10**10),
+    'coat_sig': 0.40,
+    'coat_L': 6.28*(10**-6), #m, total coating thickness
+    'coat2_E': 8.53*(10**10),
+    'coat2_sig': 0.31,
+    'coat1_L': (266*(10**-9))*11, #m, total AlGaAs thickness in the stack
+    'coat2_L': (266*(10**-9))*12, #m, total GaAs thickness in the stack
+    'tau_divisor': 400000., #Same tuning of the Fejer Tau as the Freq branch of TELossGenerator
+}
+
+components = ['phi_int', 'phi_sub', 'phi_coat', 'phi_tot']
+
+def coth(x):
+    return 1/np.tanh(x)
+
+def interface_loss(T, f, p):
+    #Zhou interface loss. p holds the material parameters at temperature T (see
+    #TEModel.properties), everything broadcasts.
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        R = ((p['coat_kap']*p['coat_cv'])/(p['sub_kap']*p['sub_cv']))**0.5
+        sub_gamma = (1+1j)*((np.pi*f*p['sub_cv']/p['sub_kap'])**0.5)
+        coat_gamma = (1+1j)*((np.pi*f*p['coat_cv']/p['coat_kap'])**0.5)
+        q = sub_gamma*p['sub_L']
+        coat_sig = p['coat_sig']
+        sub_sig = p['sub_sig']
+        coat_L = p['coat_L']
+        a = (2*coat_L*(1-coat_sig)/p['coat_E']) + (2*p['sub_L']*(1-sub_sig)/p['sub_E'])
+        b = ((1-2*coat_sig)*(1+coat_sig)*coat_L/(p['coat_E']*(1-coat_sig))) + ((1-2*sub_sig)*(1+sub_sig)*p['sub_L']/(p['sub_E']*(1-sub_sig)))
+        del_beta_para = 2*((p['coat_al']/p['coat_cv'])-(p['sub_al']/p['sub_cv']))
+        del_beta_perp = (p['coat_al']*(1+coat_sig))/(p['coat_cv']*(1-coat_sig)) - (p['sub_al']*(1+sub_sig))/(p['sub_cv']*(1-sub_sig))
+        film_factor = 1/(np.cosh(coat_gamma*coat_L)+R*np.sinh(coat_gamma*coat_L)*coth(q))
+        sub_factor = -1*(R/(coth(coat_gamma*coat_L)*np.sinh(q)+R*np.cosh(q)))
+        Theta_f_para = film_factor*del_beta_para
+        Theta_f_perp = film_factor*del_beta_perp
+        Theta_s_para = sub_factor*del_beta_para
+        Theta_s_perp = sub_factor*del_beta_perp
+        sinh_f = np.sinh(coat_gamma*coat_L)/coat_gamma
+        cosh_s = np.cosh(sub_gamma*p['sub_L'])
+        sinh_s = np.sinh(sub_gamma*p['sub_L'])/sub_gamma
+        A = ((2*coat_sig-2)*Theta_f_para*p['coat_al']*sinh_f) + ((4-2*coat_sig)*p['sub_al']*Theta_s_para*cosh_s*coat_L) - (2*p['sub_al']*Theta_s_para*sinh_s)
+        B = (p['coat_al']*Theta_f_perp*sinh_f) + (2*coat_sig*p['sub_al']*((1-coat_sig)**-1)*Theta_s_perp*cosh_s*coat_L) - ((1+sub_sig)*((1-sub_sig)**-1)*p['sub_al']*Theta_s_perp*sinh_s)
+        phi_para = 2*T*np.abs(A.imag)/a
+        phi_perp = 2*T*np.abs(B.imag)/b
+    return phi_para + phi_perp
+
+def substrate_loss(T, f, D, p):
+    #Cagnoli substrate loss with dilution factor D at frequency f
+    w = 2*np.pi*f
+    wpeak = (p['sub_kap']/p['sub_cv'])*((np.pi/p['sub_L'])**2)
+    return D*((3*p['sub_al'])**2)*p['sub_K']*T*w*wpeak/(p['sub_cv']*(w**2+wpeak**2))
+
+def coating_loss(T, f, p):
+    #Fejer effective medium loss of the multilayer
+    frac1 = p['coat1_L']/(p['coat1_L']+p['coat2_L'])
+    frac2 = p['coat2_L']/(p['coat1_L']+p['coat2_L'])
+    E_div_sig_avg = frac1*(p['coat_E']/(1-p['coat_sig'])) + frac2*(p['coat2_E']/(1-p['coat2_sig']))
+    E_al_div_sig_avg = frac1*(p['coat_E']*p['coat_al']/(1-p['coat_sig'])) + frac2*(p['coat2_E']*p['coat2_al']/(1-p['coat2_sig']))
+    w = 2*np.pi*f
+    Tau = (p['coat_L']**2)*p['coat_cv']/p['coat_kap']/p['tau_divisor']
+    R = (p['coat_cv']*p['coat_kap']/(p['sub_cv']*p['sub_kap']))**0.5
+    phi_coat_term1 = 2*p['coat_cv']*T/E_div_sig_avg
+    phi_coat_term2 = ((p['coat_cv']**-1)*E_al_div_sig_avg - (p['sub_cv']**-1)*(p['sub_E']*p['sub_al']/(1-p['sub_sig'])))**2
+    with np.errstate(over='ignore', invalid='ignore'):
+        x = (1j*w*Tau)**0.5
+        g = -1*np.sinh(x)/(x*(np.cosh(x)+R*np.sinh(x)))
+    return phi_coat_term1*phi_coat_term2*g.imag
+
+def parse_values(text):
+    #Turn "1 2 3" or "start:stop:number" into a list of floats, for the scripts' list prompts
+    text = text.strip()
+    if ':' in text:
+        start, stop, num = text.split(':')
+        return list(np.linspace(float(start), float(stop), int(num)))
+    return [float(value) for value in text.split()]
+
+def load_dilution_table(filename):
+    #Mode frequency in the first column, substrate dilution factor in the second
+    return ColumnLoader.load_columns(filename, 2)
+
+
+class TEModel(object):
+    #Holds the warm interpolators. overrides replaces any of default_params, e.g.
+    #TEModel(sub_L=0.001) for a 1 mm substrate.
+    def __init__(self, dilution_file=default_dilution_file, **overrides):
+        self.params = dict(default_params)
+        for key in overrides:
+            if key not in self.params:
+                raise KeyError('Unknown model parameter ' + key)
+            self.params[key] = overrides[key]
+        self.splines = {}
+        for key in table_nodes:
+            nodes, values = table_nodes[key]
+            self.splines[key] = interp1d(nodes, values, kind='cubic')
+        self.T_range = (float(T0[0]), float(T0[-1]))
+        self.dilution_file = dilution_file
+        self.f_D_fact = None
+        if dilution_file is not None:
+            self.mode_freq, self.D_fact = load_dilution_table(dilution_file)
+            #Outside the measured modes the dilution factor is unknown, so NaN
+            self.f_D_fact = interp1d(self.mode_freq, self.D_fact, kind='cubic', bounds_error=False, fill_value=np.nan)
+
+    def properties(self, T):
+        #Material parameters interpolated at T (any shape), plus the scalar parameters
+        T = np.asarray(T, dtype=float)
+        if T.size > 0 and (np.nanmin(T) < self.T_range[0] or np.nanmax(T) > self.T_range[1]):
+            raise ValueError('Temperatures must be between ' + str(self.T_range[0]) + ' and ' + str(self.T_range[1]) + ' K')
+        p = dict(self.params)
+        for key in self.splines:
+            p[key] = self.splines[key](T)
+        return p
+
+    def dilution(self, f):
+        if self.f_D_fact is None:
+            raise ValueError('No dilution factor table was loaded, substrate loss needs one')
+        return self.f_D_fact(np.asarray(f, dtype=float))
+
+    def phi_int(self, T, f, p=None):
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        if p is None:
+            p = self.properties(T)
+        return interface_loss(T, f, p)
+
+    def phi_sub(self, T, f, p=None, D=None):
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        if p is None:
+            p = self.properties(T)
+        if D is None:
+            D = self.dilution(f)
+        return substrate_loss(T, f, D, p)
+
+    def phi_coat(self, T, f, p=None):
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        if p is None:
+            p = self.properties(T)
+        return coating_loss(T, f, p)
+
+    def phi_tot(self, T, f, p=None, D=None):
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        if p is None:
+            p = self.properties(T)
+        return self.phi_int(T, f, p) + self.phi_sub(T, f, p, D) + self.phi_coat(T, f, p)
+
+    def evaluate(self, component, T, f):
+        #component is one of phi_int, phi_sub, phi_coat, phi_tot
+        if component not in components:
+            raise ValueError('Unknown component ' + str(component) + ', options are ' + ', '.join(components))
+        return getattr(self, component)(T, f)
+
+    def evaluate_all(self, T, f):
+        #All four components, interpolating the material parameters only once
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        p = self.properties(T)
+        out = {'phi_int': self.phi_int(T, f, p), 'phi_coat': self.phi_coat(T, f, p)}
+        out['phi_sub'] = self.phi_sub(T, f, p)
+        out['phi_tot'] = out['phi_int'] + out['phi_sub'] + out['phi_coat']
+        return out
+
+
+#Comparing many materials and geometries at once.
+#
+#A MaterialSet holds M configurations as a struct of arrays: every scalar parameter is an
+#array of length M, and every temperature table is an (M, nodes) array on the same
+#temperature nodes as above, with one cubic spline across all M rows. evaluate_all then
+#gives every loss component as an (M,) + broadcast(T, f) array in a single numpy
+#evaluation, so a catalog of material pairs costs the same as one big grid.
+#
+#Each configuration is a dictionary that changes some of the defaults, e.g.
+#    {'name': 'Si 1 mm', 'sub_L': 0.001}
+#    {'name': 'Lower coating k', 'coat_kap_scale': 0.6}
+#    {'name': 'My coating', 'coat_al': [...7 values at T0...], 'coat_E': 9*(10**10)}
+#Keys can be any of default_params, any of table_nodes (values at that table's
+#temperature nodes), a table name with _scale to multiply the default table, and
+#dilution_file to use another mode family for that configuration.
+
+
+class MaterialSet(object):
+    def __init__(self, configs, dilution_file=default_dilution_file):
+        self.configs = configs
+        self.names = [config.get('name', 'Config ' + str(k)) for k, config in enumerate(configs)]
+        M = len(configs)
+        known = set(default_params) | set(table_nodes) | set(key + '_scale' for key in table_nodes) | set(['name', 'dilution_file'])
+        for config in configs:
+            for key in config:
+                if key not in known:
+                    raise KeyError('Unknown material parameter ' + key + ' in configuration ' + str(config.get('name')))
+        #Scalars: one array of length M per parameter
+        self.params = {}
+        for key in default_params:
+            self.params[key] = np.array([float(config.get(key, default_params[key])) for config in configs])
+        #Tables: one (M, nodes) array per parameter with a spline along the last axis
+        self.splines = {}
+        for key in table_nodes:
+            nodes, default_values = table_nodes[key]
+            rows = np.zeros((M, len(nodes)))
+            for k, config in enumerate(configs):
+                rows[k] = np.asarray(config.get(key, default_values), dtype=float)*config.get(key + '_scale', 1.0)
+            self.splines[key] = interp1d(nodes, rows, kind='cubic', axis=-1)
+        self.T_range = (float(T0[0]), float(T0[-1]))
+        #Dilution factors, most configurations will share the default mode family
+        self.dilution_files = [config.get('dilution_file', dilution_file) for config in configs]
+        self._dilution = {}
+        for filename in set(self.dilution_files):
+            mode_freq, D_fact = load_dilution_table(filename)
+            self._dilution[filename] = interp1d(mode_freq, D_fact, kind='cubic', bounds_error=False, fill_value=np.nan)
+
+    def __len__(self):
+        return len(self.configs)
+
+    def properties(self, T):
+        #Every parameter as an array of shape (M,) + T.shape
+        T = np.asarray(T, dtype=float)
+        if T.size > 0 and (np.nanmin(T) < self.T_range[0] or np.nanmax(T) > self.T_range[1]):
+            raise ValueError('Temperatures must be between ' + str(self.T_range[0]) + ' and ' + str(self.T_range[1]) + ' K')
+        config_shape = (len(self),) + (1,)*T.ndim
+        p = {}
+        for key in self.params:
+            p[key] = self.params[key].reshape(config_shape)
+        for key in self.splines:
+            p[key] = self.splines[key](T)
+        return p
+
+    def dilution(self, f):
+        f = np.asarray(f, dtype=float)
+        D = np.zeros((len(self),) + f.shape)
+        for filename in self._dilution:
+            rows = [k for k in range(len(self)) if self.dilution_files[k] == filename]
+            D[rows] = self._dilution[filename](f)
+        return D
+
+    def evaluate_all(self, T, f):
+        #Returns phi_int, phi_sub, phi_coat and phi_tot, each (M,) + broadcast(T, f)
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        p = self.properties(T)
+        out = {'phi_int': interface_loss(T, f, p), 'phi_coat': coating_loss(T, f, p)}
+        out['phi_sub'] = substrate_loss(T, f, self.dilution(f), p)
+        out['phi_tot'] = out['phi_int'] + out['phi_sub'] + out['phi_coat']
+        return out
+
+def load_catalog(filename):
+    #A catalog is a json file holding a list of configuration dictionaries
+    import json
+    with open(filename) as f:
+        return json.load(f)
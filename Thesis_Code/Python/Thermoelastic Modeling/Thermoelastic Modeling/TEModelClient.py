@@ -0,0 +1,44 @@
+#Client helper for TEModelServer.py, for scripts and notebooks. Start the server once, then:
+#    import TEModelClient
+#    TEModelClient.query(45., 8100.)                          #phi_tot at one point
+#    TEModelClient.query([12, 20, 45], 8100., 'phi_int')      #Several temperatures
+#    client = TEModelClient.TEModelClient(port=8765)
+#    phi = client.query(Temper[:, None], freq[None, :])       #Whole surface in one request
+#T and f are broadcast against each other and the answer comes back as a numpy array
+#of the broadcast shape.
+
+import json
+import numpy as np
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+default_port = 8765
+
+
+class TEModelClient(object):
+    def __init__(self, host='127.0.0.1', port=default_port, timeout=60):
+        self.url = 'http://' + host + ':' + str(port)
+        self.timeout = timeout
+
+    def query(self, T, f, component='phi_tot'):
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        body = json.dumps({'T': T.ravel().tolist(), 'f': f.ravel().tolist(), 'component': component})
+        request = Request(self.url + '/evaluate', body.encode('utf-8'), {'Content-Type': 'application/json'})
+        try:
+            response = urlopen(request, timeout=self.timeout)
+        except HTTPError as error:
+            message = json.loads(error.read().decode('utf-8')).get('error', str(error))
+            raise ValueError('Model server refused the query: ' + message)
+        phi = json.loads(response.read().decode('utf-8'))['phi']
+        return np.array(phi, dtype=float).reshape(T.shape)
+
+    def info(self):
+        response = urlopen(self.url + '/info', timeout=self.timeout)
+        return json.loads(response.read().decode('utf-8'))
+
+def query(T, f, component='phi_tot', port=default_port):
+    return TEModelClient(port=port).query(T, f, component)
@@ -0,0 +1,177 @@
+#This script starts a long running local server that answers thermoelastic loss questions
+#("phi at 8100 Hz, 45 K?") without restarting Python, rebuilding the splines and answering
+#prompts every time. The material splines and the dilution factor table are loaded once
+#(see TEModel.py) and kept warm for as long as the server runs.
+#
+#The server listens on localhost only. Send it a POST to /evaluate with a JSON body
+#    {"T": [45, 50], "f": [8100, 8100], "component": "phi_tot"}
+#and it answers with {"phi": [...]}. T and f can be single numbers or lists (they are
+#broadcast against each other), component is phi_int, phi_sub, phi_coat or phi_tot.
+#GET /info returns the model parameters and valid temperature and frequency ranges.
+#Use TEModelClient.py instead of writing the requests by hand.
+#
+#Requests that arrive at about the same time are merged: the batcher waits batch_window
+#seconds after the first request for more to come in, then evaluates everything asking for
+#the same component in one vectorized call and hands each request its slice back.
+
+import json
+import threading
+import time
+import numpy as np
+import TEModel
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    import queue
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import Queue as queue
+
+default_port = 8765
+batch_window = 0.002 #Seconds to wait for more requests to merge into a batch
+max_batch_points = 10**7 #Stop collecting once a batch is this big
+
+
+class QueryBatcher(object):
+    #Collects queries from the request threads and evaluates them together on one thread
+    def __init__(self, model):
+        self.model = model
+        self.queue = queue.Queue()
+        self.n_batches = 0
+        self.n_queries = 0
+        worker = threading.Thread(target=self._run)
+        worker.daemon = True
+        worker.start()
+
+    def submit(self, component, T, f):
+        #Called from a request thread, blocks until the batch holding this query is done
+        T, f = np.broadcast_arrays(np.asarray(T, dtype=float), np.asarray(f, dtype=float))
+        job = {'component': component, 'T': T.ravel(), 'f': f.ravel(), 'shape': T.shape, 'done': threading.Event()}
+        self.queue.put(job)
+        job['done'].wait()
+        if 'error' in job:
+            raise job['error']
+        return job['result'].reshape(job['shape'])
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            n_points = len(batch[0]['T'])
+            deadline = time.time() + batch_window
+            while n_points < max_batch_points:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    job = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(job)
+                n_points += len(job['T'])
+            self._evaluate(batch)
+
+    def _evaluate(self, batch):
+        by_component = {}
+        for job in batch:
+            by_component.setdefault(job['component'], []).append(job)
+        for component in by_component:
+            jobs = by_component[component]
+            try:
+                T = np.concatenate([job['T'] for job in jobs])
+                f = np.concatenate([job['f'] for job in jobs])
+                phi = self.model.evaluate(component, T, f)
+                start = 0
+                for job in jobs:
+                    job['result'] = phi[start:start+len(job['T'])]
+                    start += len(job['T'])
+            except Exception as error:
+                #One bad query shouldn't fail the others it was batched with, so redo
+                #this component's jobs one at a time to find the guilty one
+                for job in jobs:
+                    try:
+                        job['result'] = self.model.evaluate(component, job['T'], job['f'])
+                    except Exception as job_error:
+                        job['error'] = job_error
+            for job in jobs:
+                job['done'].set()
+        self.n_batches += 1
+        self.n_queries += len(batch)
+
+
+class ModelRequestHandler(BaseHTTPRequestHandler):
+    def _reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/info':
+            self._reply(404, {'error': 'Unknown path ' + self.path})
+            return
+        model = self.server.batcher.model
+        info = {
+            'components': TEModel.components,
+            'params': model.params,
+            'T_range': model.T_range,
+            'dilution_file': model.dilution_file,
+            'batches': self.server.batcher.n_batches,
+            'queries': self.server.batcher.n_queries,
+        }
+        if model.f_D_fact is not None:
+            info['f_range_phi_sub'] = [float(model.mode_freq[0]), float(model.mode_freq[-1])]
+        self._reply(200, info)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/evaluate':
+            self._reply(404, {'error': 'Unknown path ' + self.path})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            query = json.loads(self.rfile.read(length).decode('utf-8'))
+            component = query.get('component', 'phi_tot')
+            phi = self.server.batcher.submit(component, query['T'], query['f'])
+        except (KeyError, ValueError, TypeError) as error:
+            self._reply(400, {'error': str(error)})
+            return
+        self._reply(200, {'phi': phi.tolist()})
+
+    def log_message(self, format, *args):
+        #Keep the terminal quiet, one line per request is too much when batching
+        pass
+
+
+class ModelServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    #The default listen backlog of 5 drops connections when dozens of clients query at once,
+    #which is exactly the load the batcher is for
+    request_queue_size = 128
+
+def make_server(model, port=default_port):
+    server = ModelServer(('127.0.0.1', port), ModelRequestHandler)
+    server.batcher = QueryBatcher(model)
+    return server
+
+
+if __name__ == '__main__':
+    print("Please enter the port to serve on (leave blank for " + str(default_port) + "):")
+    port_str = raw_input()
+    port = int(port_str) if port_str != '' else default_port
+
+    print("Please enter the dilution factor file for the substrate mode family (leave blank for the AlGaAs test data):")
+    dilution_file = raw_input()
+    if dilution_file == '':
+        dilution_file = TEModel.default_dilution_file
+
+    model = TEModel.TEModel(dilution_file)
+    server = make_server(model, port)
+    print('Thermoelastic loss model server running on http://127.0.0.1:' + str(port) + ' (Ctrl-C to stop)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
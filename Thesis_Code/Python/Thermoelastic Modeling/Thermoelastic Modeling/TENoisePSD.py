@@ -0,0 +1,46 @@
+#Converts thermoelastic loss angles into displacement thermal noise spectral densities using
+#the fluctuation-dissipation theorem. We use Levin's direct approach for a Gaussian beam
+#reading out the face of the substrate (Levin 1998, "Internal thermal noise in the LIGO test
+#masses: A direct approach"):
+#
+#   S_x(f) = 2*k_B*T*(1 - sig^2)*phi(f) / (pi^(3/2) * f * E * r0)      [m^2/Hz]
+#
+#where E and sig are the substrate Young's modulus and Poisson ratio, and r0 is the beam
+#radius at which the intensity falls to 1/e (r0 = w/sqrt(2) for the usual 1/e^2 radius w).
+#Each loss component is treated as an effective loss angle of the sample, so the PSDs of
+#phi_int, phi_sub and phi_coat add up to the PSD of phi_tot just like the loss angles do.
+#
+#The formula assumes the substrate is thick compared to the beam (half-infinite mirror). It
+#has no finite thickness correction, so instead beams wider than max_beam_fraction of the
+#substrate thickness sub_L are refused (ValueError) rather than giving a PSD that is off.
+#
+#Everything broadcasts, so a (Temper, freq) surface of loss angles turns into a surface of
+#PSDs in one call, reusing the loss arrays that were already computed.
+
+import numpy as np
+
+k_B = 1.380649*(10**-23) #Boltzmann constant, J/K
+max_beam_fraction = 0.5 #Largest beam radius r0 the formula is used for, as a fraction of sub_L
+
+def beam_fits(r0, sub_L):
+    return r0 <= max_beam_fraction*sub_L
+
+def displacement_psd(f, T, phi, E, sig, r0):
+    f = np.asarray(f, dtype=float)
+    T = np.asarray(T, dtype=float)
+    phi = np.asarray(phi, dtype=float)
+    return 2*k_B*T*(1-sig**2)*phi/((np.pi**1.5)*f*E*r0)
+
+def thermal_noise_psd(f, T, phis, E, sig, r0, sub_L):
+    #phis is a dictionary of loss angle arrays (phi_int, phi_sub, phi_coat, phi_tot) that
+    #broadcast against f and T. Returns a dictionary of PSDs named psd_int, psd_sub, etc.
+    if not beam_fits(r0, sub_L):
+        raise ValueError('A beam radius of ' + str(r0) + ' m is too big for the half-infinite PSD on a ' + str(sub_L) + ' m substrate, it has to be at most ' + str(max_beam_fraction*sub_L) + ' m')
+    psds = {}
+    for name in phis:
+        psds[name.replace('phi_', 'psd_')] = displacement_psd(f, T, phis[name], E, sig, r0)
+    return psds
+
+def amplitude_spectral_density(psd):
+    #sqrt(S_x) in m/sqrt(Hz), what is usually plotted against detector sensitivity
+    return np.sqrt(np.asarray(psd, dtype=float))
@@ -0,0 +1,201 @@
+#Plotting helpers for TELossGenerator.
+#
+#The 2D loss curves have 100,000 points, but on a log frequency axis almost all of those
+#land on the same few pixels, which makes drawing and zooming slow. decimated_plot() only
+#hands matplotlib about two points per horizontal pixel of the axes. The points are picked
+#with the largest-triangle-three-buckets (LTTB) method, which keeps the points that make
+#the biggest triangles with their neighbours, so peaks and knees survive. The buckets are
+#equal width in log(x) when the x axis is logarithmic, so they match the pixel columns.
+#
+#Only the drawn line is decimated. The full resolution arrays are kept on the
+#DecimatedLine (full_x, full_y) for export, and the line is re-decimated from them
+#whenever you zoom or pan, so zooming in shows the full detail again.
+
+import numpy as np
+
+points_per_pixel = 2 #Number of points drawn per horizontal pixel of the axes
+
+def _transform(values, scale):
+    #Move data into the space it is drawn in (log10 for log axes) so buckets and
+    #triangle areas are measured the way they look on screen
+    values = np.asarray(values, dtype=float)
+    if scale == 'log':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(values > 0, np.log10(np.where(values > 0, values, 1.0)), np.nan)
+    return values
+
+def lttb(x, y, n_buckets):
+    #Largest-triangle-three-buckets on points that are already in screen space.
+    #x must be sorted. Buckets are equal width in x (empty ones are skipped), the first
+    #and last points are always kept, and one point is kept from each bucket. Returns
+    #the indices of the kept points.
+    n = len(x)
+    if n <= n_buckets + 2 or n < 3:
+        return np.arange(n)
+    edges = np.searchsorted(x, np.linspace(x[0], x[n-1], n_buckets + 1))
+    edges[-1] = n - 1
+    edges = np.unique(np.clip(edges, 1, n - 1))
+    starts = edges[:-1]
+    stops = edges[1:]
+    #Bucket averages are the third point of each triangle, work them out in one go
+    counts = stops - starts
+    mean_x = np.add.reduceat(x[:n-1], starts)/counts
+    mean_y = np.add.reduceat(y[:n-1], starts)/counts
+    keep = np.zeros(len(starts) + 2, dtype=int)
+    keep[-1] = n - 1
+    a = 0
+    for b in range(len(starts)):
+        if b < len(starts) - 1:
+            cx = mean_x[b+1]
+            cy = mean_y[b+1]
+        else:
+            cx = x[n-1]
+            cy = y[n-1]
+        bx = x[starts[b]:stops[b]]
+        by = y[starts[b]:stops[b]]
+        area = np.abs((x[a] - cx)*(by - y[a]) - (x[a] - bx)*(cy - y[a]))
+        a = starts[b] + int(np.argmax(area))
+        keep[b+1] = a
+    return keep
+
+def decimate(x, y, n_buckets, xscale='linear', yscale='linear'):
+    #Pick the points of (x, y) to draw with n_buckets pixel columns. Points that can't be
+    #shown (non-positive values on a log axis, NaNs) are dropped first.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    order = np.argsort(x, kind='mergesort')
+    if np.any(order != np.arange(len(x))):
+        x = x[order]
+        y = y[order]
+    sx = _transform(x, xscale)
+    sy = _transform(y, yscale)
+    good = np.isfinite(sx) & np.isfinite(sy)
+    if not np.all(good):
+        x, y, sx, sy = x[good], y[good], sx[good], sy[good]
+    keep = lttb(sx, sy, n_buckets)
+    return x[keep], y[keep]
+
+
+class DecimatedLine(object):
+    #Holds the full resolution data behind a decimated Line2D and redraws the line from
+    #it whenever the x limits change.
+    def __init__(self, ax, x, y, xscale, yscale, **kwargs):
+        self.ax = ax
+        self.full_x = np.asarray(x, dtype=float)
+        self.full_y = np.asarray(y, dtype=float)
+        order = np.argsort(self.full_x, kind='mergesort')
+        self._sorted_x = self.full_x[order]
+        self._sorted_y = self.full_y[order]
+        self.xscale = xscale
+        self.yscale = yscale
+        xd, yd = decimate(self._sorted_x, self._sorted_y, self.n_buckets(), xscale, yscale)
+        self.line, = ax.plot(xd, yd, **kwargs)
+        self.line.decimated = self #So the full data can be found from the artist too
+        self._cid = ax.callbacks.connect('xlim_changed', self._on_xlim)
+
+    def n_buckets(self):
+        width = self.ax.get_window_extent().width
+        return max(int(points_per_pixel*width), 10)
+
+    def full_data(self):
+        #Full resolution arrays, for saving or exporting
+        return self.full_x, self.full_y
+
+    def _on_xlim(self, ax):
+        lo, hi = ax.get_xlim()
+        if lo > hi:
+            lo, hi = hi, lo
+        #Include one point past each edge so the line runs off the side of the axes
+        i0 = max(np.searchsorted(self._sorted_x, lo) - 1, 0)
+        i1 = min(np.searchsorted(self._sorted_x, hi, side='right') + 1, len(self._sorted_x))
+        xd, yd = decimate(self._sorted_x[i0:i1], self._sorted_y[i0:i1], self.n_buckets(), self.xscale, self.yscale)
+        self.line.set_data(xd, yd)
+
+
+def decimated_plot(ax, x, y, xscale='linear', yscale='linear', **kwargs):
+    #Drop-in for ax.plot(x, y, **kwargs) on long curves. Sets the axis scales first since
+    #the decimation depends on them. Returns the DecimatedLine, its .line is the Line2D.
+    ax.set_xscale(xscale)
+    ax.set_yscale(yscale)
+    return DecimatedLine(ax, x, y, xscale, yscale, **kwargs)
+
+
+#Heatmaps of the temperature-frequency loss surface.
+#
+#plot_surface draws one polygon per grid cell, so it crawls past about 1000x1000 cells.
+#loss_heatmap() instead picks the nearest grid row and column for every pixel of the
+#output image (evenly spaced in log frequency and in temperature) and draws only those
+#with imshow, so the rendering time depends on the image size and not on the grid size.
+#The surface can be an ndarray or a LazyArray from TEResultStore, in which case only the
+#rows that land on a pixel are read from disk. Figures are drawn on the Agg canvas, no
+#window is opened, and the file type follows the extension (.png, .svg, .pdf).
+
+def _pixel_index(axis_values, n_pixels, log_axis):
+    #Index of the grid point nearest to each of n_pixels evenly spaced positions
+    values = np.asarray(axis_values, dtype=float)
+    if log_axis:
+        values = np.log10(values)
+    if len(values) <= n_pixels:
+        return np.arange(len(values)), values
+    targets = np.linspace(values[0], values[-1], n_pixels)
+    idx = np.clip(np.searchsorted(values, targets), 1, len(values) - 1)
+    left_closer = (targets - values[idx-1]) < (values[idx] - targets)
+    idx = np.where(left_closer, idx - 1, idx)
+    return idx, targets
+
+def _sample_surface(phi, rows, cols):
+    if hasattr(phi, 'take_rows'):
+        block = phi.take_rows(rows)
+    else:
+        block = np.asarray(phi)[rows]
+    return block[:, cols]
+
+def _log_tick(value, pos):
+    return '$10^{%g}$' % value
+
+def draw_heatmap(fig, ax, freq, Temper, phi, title='', contours=None, cmap='coolwarm', cbar_label='Loss Angle log($\phi$)'):
+    #Draws the heatmap on existing axes, sampling one grid point per pixel of ax
+    import matplotlib.ticker as mticker
+
+    ax_box = ax.get_window_extent()
+    cols, logf = _pixel_index(freq, max(int(ax_box.width), 2), True)
+    rows, temps = _pixel_index(Temper, max(int(ax_box.height), 2), False)
+    image = _sample_surface(phi, rows, cols).astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_image = np.where(image > 0, np.log10(np.where(image > 0, image, 1.0)), np.nan)
+
+    extent = [logf[0], logf[-1], temps[0], temps[-1]]
+    im = ax.imshow(log_image, origin='lower', aspect='auto', extent=extent, interpolation='nearest', cmap=cmap)
+    cbar = fig.colorbar(im, ax=ax)
+    cbar.set_label(cbar_label)
+    if contours is not None and len(contours) > 0:
+        levels = np.log10(np.sort(np.asarray(contours, dtype=float)))
+        cs = ax.contour(logf, temps, log_image, levels=levels, colors='k', linestyles='solid', linewidths=0.8)
+        ax.clabel(cs, fmt=lambda v: '%.0e' % (10**v), fontsize=8)
+    ax.xaxis.set_major_locator(mticker.MaxNLocator(integer=True))
+    ax.xaxis.set_major_formatter(mticker.FuncFormatter(_log_tick))
+    ax.set_xlabel('Frequency (Hz)')
+    ax.set_ylabel('Temperature (K)')
+    ax.set_title(title)
+    return im
+
+def loss_heatmap(freq, Temper, phi, filename, title='', contours=None, width_px=1200, height_px=800, dpi=100, cmap='coolwarm', cbar_label='Loss Angle log($\phi$)'):
+    #freq and Temper are the axes of phi (phi[j][i] is at Temper[j], freq[i]), both
+    #sorted. contours is an optional list of loss angles to draw iso-loss lines at.
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(width_px/float(dpi), height_px/float(dpi)), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    draw_heatmap(fig, ax, freq, Temper, phi, title, contours, cmap, cbar_label)
+    fig.savefig(filename, dpi=dpi)
+    return filename
+
+def heatmap_from_results(result_dir, component, filename, contours=None, **kwargs):
+    #Render a surface saved by TELossGenerator (see TEResultStore) without loading it
+    import TEResultStore
+    res = TEResultStore.open_results(result_dir)
+    phi = res[component]
+    axes = phi.axes if phi.axes is not None else ['Temper', 'freq']
+    return loss_heatmap(res[axes[1]], res[axes[0]], phi, filename, contours=contours, **kwargs)
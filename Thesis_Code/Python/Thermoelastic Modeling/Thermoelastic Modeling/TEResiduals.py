@@ -0,0 +1,117 @@
+#Scores the thermoelastic model against measured loss data. Instead of computing the model on
+#a 100k point temperature grid and overlaying the data (the Freq branch of TELossGenerator),
+#the model is evaluated only at the measured (temperature, mode frequency) pairs, so the
+#whole data set is one vectorized TEModel call.
+#
+#The data files are the "Mode N Averaged Phi <f>Hz.txt" files (temperature, loss, standard
+#deviation columns), the mode number and frequency are read from the file name. For every
+#point we return
+#   residual            = measured loss - modeled loss
+#   normalized residual = residual / standard deviation (NaN where the deviation is 0)
+#and chi^2 (sum of squared normalized residuals) for each mode and overall. Points the
+#model can't be evaluated at (temperature outside the material tables, or a mode outside
+#the dilution factor table when the substrate loss is included) are NaN and left out of
+#the chi^2 sums, the counts say how many points went in.
+#
+#Example:
+#    data = load_mode_data('Didio_AlGaAs_TestData')
+#    result = model_residuals(TEModel.TEModel(), data, 'phi_tot')
+#    result['chi2_mode'], result['chi2']
+
+import os
+import re
+import sys
+import glob
+import numpy as np
+import TEModel
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'SharedTools', 'SharedTools'))
+import ColumnLoader
+
+mode_file_pattern = re.compile(r'Mode (\d+) Averaged Phi ([0-9.]+) ?Hz\.txt$')
+
+def load_mode_data(directory):
+    #Load every mode file in directory into flat arrays, one entry per measured point
+    modes = []
+    freqs = []
+    blocks = []
+    for filename in glob.glob(os.path.join(directory, 'Mode * Averaged Phi *Hz.txt')):
+        match = mode_file_pattern.search(os.path.basename(filename))
+        if match is None:
+            continue
+        data = ColumnLoader.load_table(filename)[:, :3]
+        modes.append(int(match.group(1)))
+        freqs.append(float(match.group(2)))
+        blocks.append(data)
+    if len(blocks) == 0:
+        raise IOError('No "Mode N Averaged Phi <f>Hz.txt" files found in ' + directory)
+    order = np.argsort(modes)
+    mode_numbers = np.array(modes)[order]
+    mode_freqs = np.array(freqs)[order]
+    blocks = [blocks[k] for k in order]
+    counts = np.array([len(block) for block in blocks])
+    stacked = np.concatenate(blocks)
+    return {
+        'mode_numbers': mode_numbers, #One entry per mode
+        'mode_freqs': mode_freqs,
+        'mode_index': np.repeat(np.arange(len(blocks)), counts), #One entry per point from here on
+        'T': stacked[:, 0],
+        'f': np.repeat(mode_freqs, counts),
+        'phi': stacked[:, 1],
+        'std': stacked[:, 2],
+    }
+
+def model_residuals(model, data, component='phi_tot'):
+    #Evaluate the model at every measured (T, f) pair in one call and score it
+    T = data['T']
+    f = data['f']
+    phi_model = np.full(len(T), np.nan)
+    valid = (T >= model.T_range[0]) & (T <= model.T_range[1])
+    phi_model[valid] = model.evaluate(component, T[valid], f[valid])
+
+    residual = data['phi'] - phi_model
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = np.where(data['std'] > 0, residual/data['std'], np.nan)
+    used = np.isfinite(normalized)
+    n_modes = len(data['mode_numbers'])
+    chi2_mode = np.bincount(data['mode_index'][used], weights=normalized[used]**2, minlength=n_modes)
+    n_mode = np.bincount(data['mode_index'][used], minlength=n_modes)
+    return {
+        'phi_model': phi_model,
+        'residual': residual,
+        'normalized': normalized,
+        'chi2_mode': chi2_mode,
+        'n_mode': n_mode,
+        'chi2': float(np.sum(chi2_mode)),
+        'n': int(np.sum(n_mode)),
+    }
+
+
+if __name__ == '__main__':
+    print("Please enter the directory holding the Mode N Averaged Phi files (leave blank for Didio_AlGaAs_TestData):")
+    data_dir = raw_input()
+    if data_dir == '':
+        data_dir = os.path.join(TEModel.here, 'Didio_AlGaAs_TestData')
+    print("Which model component do you want to compare with? (phi_int, phi_sub, phi_coat, phi_tot):")
+    component = raw_input()
+    while component not in TEModel.components:
+        print("Please enter one of phi_int, phi_sub, phi_coat or phi_tot:")
+        component = raw_input()
+
+    data = load_mode_data(data_dir)
+    result = model_residuals(TEModel.TEModel(), data, component)
+
+    print('Mode  Freq (Hz)  Points  chi^2  chi^2/point')
+    for k in range(len(data['mode_numbers'])):
+        per_point = result['chi2_mode'][k]/result['n_mode'][k] if result['n_mode'][k] > 0 else np.nan
+        print(str(data['mode_numbers'][k]) + '  ' + str(data['mode_freqs'][k]) + '  ' + str(result['n_mode'][k]) + '  ' + str(result['chi2_mode'][k]) + '  ' + str(per_point))
+    print('Overall chi^2 = ' + str(result['chi2']) + ' from ' + str(result['n']) + ' points')
+
+    print("Enter a file name to write the point by point residuals to (leave blank to skip):")
+    output_file = raw_input()
+    if output_file != '':
+        with open(output_file, 'w') as f:
+            f.write('#Mode Freq(Hz) T(K) PhiMeas StdMeas PhiModel Residual NormResidual\n')
+            for i in range(len(data['T'])):
+                k = data['mode_index'][i]
+                f.write(str(data['mode_numbers'][k]) + ' ' + str(data['f'][i]) + ' ' + str(data['T'][i]) + ' ' + str(data['phi'][i]) + ' ' + str(data['std'][i]) + ' ' + str(result['phi_model'][i]) + ' ' + str(result['residual'][i]) + ' ' + str(result['normalized'][i]) + '\n')
@@ -0,0 +1,289 @@
+#This module saves the arrays TELossGenerator computes (the frequency and temperature axes
+#and the loss components) to a result directory, so later comparisons don't need a rerun.
+#Every array is cut into chunks along its first axis (rows of Temper for the 3D surfaces)
+#and each chunk is stored as its own compressed .npz file. A manifest.json file in the
+#directory records the shape, dtype, axes and chunking of every array, along with any run
+#settings you pass in (temperature held constant, etc).
+#
+#Reading is lazy: open_results() only reads the manifest, and slicing an array only
+#decompresses the chunks that the slice touches. This lets you work with a 1e8 cell
+#surface a few rows at a time. Example:
+#    res = open_results('AlGaAs_run')
+#    res['phi_tot'][500:510]     #Only loads the chunk(s) holding rows 500-509
+#    res['phi_tot'].shape        #Doesn't load anything
+#    res.attrs['const_temp']     #Run settings saved with the arrays
+
+import os
+import json
+import numpy as np
+
+manifest_name = 'manifest.json'
+chunk_bytes = 8*(10**6) #Target uncompressed size of one chunk, about 8 MB
+
+def default_chunk_rows(shape, dtype):
+    #Pick how many rows go into a chunk so each chunk is about chunk_bytes large
+    row_bytes = np.dtype(dtype).itemsize
+    for n in shape[1:]:
+        row_bytes = row_bytes*n
+    return max(1, int(chunk_bytes//max(row_bytes, 1)))
+
+def _to_json(value):
+    #Numpy scalars and arrays don't go into json on their own
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class ResultWriter(object):
+    #Writes arrays into a result directory. Use write() for arrays you already have in
+    #memory, or create() followed by append() to stream a surface in row by row as it
+    #is computed. The manifest is rewritten whenever a chunk lands on disk so a partially
+    #written directory can still be read. Writing into a directory that already holds results
+    #replaces them, the chunk files of the old manifest's arrays are deleted first.
+    def __init__(self, path, attrs=None):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._clear_old_results()
+        self.manifest = {'attrs': {}, 'arrays': {}}
+        self._pending = {} #Rows waiting to fill up a chunk, per array
+        if attrs is not None:
+            self.set_attrs(attrs)
+
+    def set_attrs(self, attrs):
+        for key in attrs:
+            self.manifest['attrs'][key] = _to_json(attrs[key])
+        self._write_manifest()
+
+    def write(self, name, array, axes=None, chunk_rows=None):
+        array = np.asarray(array)
+        if array.ndim == 0:
+            array = array.reshape(1)
+        self.create(name, array.shape[1:], array.dtype, axes=axes, chunk_rows=chunk_rows)
+        self.append(name, array)
+
+    def create(self, name, row_shape, dtype, axes=None, chunk_rows=None):
+        #row_shape is the shape of everything except the first axis, () for 1D arrays
+        row_shape = tuple(int(n) for n in row_shape)
+        self._remove_chunks(name)
+        if chunk_rows is None:
+            chunk_rows = default_chunk_rows((0,) + row_shape, dtype)
+        self.manifest['arrays'][name] = {
+            'shape': [0] + list(row_shape),
+            'dtype': np.dtype(dtype).str,
+            'axes': axes,
+            'chunk_rows': int(chunk_rows),
+            'n_chunks': 0,
+        }
+        self._pending[name] = []
+        self._write_manifest()
+
+    def append(self, name, rows):
+        #Add rows to the end of an array. Full chunks are written out straight away,
+        #leftover rows are held until the next append or flush.
+        info = self.manifest['arrays'][name]
+        rows = np.asarray(rows, dtype=np.dtype(info['dtype']))
+        if rows.ndim == len(info['shape']) - 1:
+            rows = rows[np.newaxis]
+        if list(rows.shape[1:]) != info['shape'][1:]:
+            raise ValueError('Rows of shape ' + str(rows.shape[1:]) + ' do not fit array ' + name + ' with row shape ' + str(tuple(info['shape'][1:])))
+        pending = self._pending[name]
+        pending.append(rows)
+        n_pending = sum(len(block) for block in pending)
+        if n_pending >= info['chunk_rows']:
+            block = np.concatenate(pending)
+            n_full = (len(block)//info['chunk_rows'])*info['chunk_rows']
+            k = 0
+            while k < n_full:
+                self._write_chunk(name, block[k:k+info['chunk_rows']])
+                k += info['chunk_rows']
+            self._pending[name] = [block[n_full:]] if n_full < len(block) else []
+            self._write_manifest()
+
+    def flush(self, name=None):
+        names = [name] if name is not None else list(self._pending.keys())
+        for key in names:
+            pending = self._pending.get(key, [])
+            if len(pending) > 0:
+                block = np.concatenate(pending)
+                if len(block) > 0:
+                    self._write_chunk(key, block)
+            self._pending[key] = []
+        self._write_manifest()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _clear_old_results(self):
+        manifest_file = os.path.join(self.path, manifest_name)
+        if not os.path.exists(manifest_file):
+            return
+        with open(manifest_file) as f:
+            old_manifest = json.load(f)
+        for name in old_manifest['arrays']:
+            self._remove_chunks(name)
+        os.remove(manifest_file)
+
+    def _remove_chunks(self, name):
+        #Every <name>.<k>.npz chunk file, including any written after the last manifest
+        for filename in os.listdir(self.path):
+            if filename.startswith(name + '.') and filename.endswith('.npz') and filename[len(name) + 1:-4].isdigit():
+                os.remove(os.path.join(self.path, filename))
+
+    def _write_chunk(self, name, block):
+        info = self.manifest['arrays'][name]
+        chunk_file = os.path.join(self.path, name + '.' + str(info['n_chunks']) + '.npz')
+        np.savez_compressed(chunk_file, data=block)
+        info['n_chunks'] += 1
+        info['shape'][0] += len(block)
+
+    def _write_manifest(self):
+        #Write to a temporary file first so a reader never sees half a manifest
+        tmp_file = os.path.join(self.path, manifest_name + '.tmp')
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        if os.path.exists(os.path.join(self.path, manifest_name)):
+            os.remove(os.path.join(self.path, manifest_name))
+        os.rename(tmp_file, os.path.join(self.path, manifest_name))
+
+
+class LazyArray(object):
+    #Array-like view of one array in a result directory. Indexing along the first axis
+    #only loads the chunks that are needed, the rest of the index is applied to the
+    #loaded rows. The most recently used chunk is kept so stepping through rows one at
+    #a time doesn't decompress the same chunk over and over.
+    def __init__(self, path, name, info):
+        self.path = path
+        self.name = name
+        self.shape = tuple(info['shape'])
+        self.dtype = np.dtype(info['dtype'])
+        self.axes = info.get('axes')
+        self.chunk_rows = info['chunk_rows']
+        self.n_chunks = info['n_chunks']
+        self.ndim = len(self.shape)
+        self._cached_k = None
+        self._cached_chunk = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _chunk(self, k):
+        if k != self._cached_k:
+            chunk_file = os.path.join(self.path, self.name + '.' + str(k) + '.npz')
+            with np.load(chunk_file) as npz:
+                self._cached_chunk = npz['data']
+            self._cached_k = k
+        return self._cached_chunk
+
+    def read_rows(self, start, stop):
+        #Return rows start:stop (no negative indices) as an ndarray
+        start = max(0, min(start, self.shape[0]))
+        stop = max(start, min(stop, self.shape[0]))
+        if stop == start:
+            return np.zeros((0,) + self.shape[1:], dtype=self.dtype)
+        k0 = start//self.chunk_rows
+        k1 = (stop - 1)//self.chunk_rows
+        blocks = []
+        for k in range(k0, k1 + 1):
+            chunk = self._chunk(k)
+            lo = max(start - k*self.chunk_rows, 0)
+            hi = min(stop - k*self.chunk_rows, len(chunk))
+            blocks.append(chunk[lo:hi])
+        if len(blocks) == 1:
+            return blocks[0].copy()
+        return np.concatenate(blocks)
+
+    def take_rows(self, rows):
+        #Return an arbitrary list of rows, loading each chunk involved only once
+        rows = np.asarray(rows, dtype=int)
+        rows = np.where(rows < 0, rows + self.shape[0], rows)
+        out = np.zeros((len(rows),) + self.shape[1:], dtype=self.dtype)
+        chunk_idx = rows//self.chunk_rows
+        for k in np.unique(chunk_idx):
+            sel = np.nonzero(chunk_idx == k)[0]
+            out[sel] = self._chunk(int(k))[rows[sel] - k*self.chunk_rows]
+        return out
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        first = key[0]
+        rest = key[1:]
+        if isinstance(first, slice):
+            start, stop, step = first.indices(self.shape[0])
+            if step == 1:
+                block = self.read_rows(start, stop)
+            else:
+                block = self.take_rows(np.arange(start, stop, step))
+        elif isinstance(first, (int, np.integer)):
+            if first < 0:
+                first += self.shape[0]
+            if first < 0 or first >= self.shape[0]:
+                raise IndexError('Row ' + str(key[0]) + ' is out of range for ' + self.name)
+            block = self.read_rows(first, first + 1)[0]
+        else:
+            block = self.take_rows(first)
+            return block[(slice(None),) + rest]
+        if len(rest) == 0:
+            return block
+        if isinstance(first, (int, np.integer)):
+            return block[rest]
+        return block[(slice(None),) + rest]
+
+    def __array__(self, dtype=None, copy=None):
+        full = self.read_rows(0, self.shape[0])
+        if dtype is not None:
+            full = full.astype(dtype)
+        return full
+
+    def iter_rows(self, block_rows=None):
+        #Step through the array one block at a time without holding all of it
+        if block_rows is None:
+            block_rows = self.chunk_rows
+        start = 0
+        while start < self.shape[0]:
+            yield start, self.read_rows(start, start + block_rows)
+            start += block_rows
+
+
+class ResultReader(object):
+    #Opens a result directory written by ResultWriter. res[name] gives a LazyArray.
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, manifest_name)) as f:
+            self.manifest = json.load(f)
+        self.attrs = self.manifest['attrs']
+
+    def names(self):
+        return sorted(self.manifest['arrays'].keys())
+
+    def __contains__(self, name):
+        return name in self.manifest['arrays']
+
+    def __getitem__(self, name):
+        if name not in self.manifest['arrays']:
+            raise KeyError('No array named ' + name + ' in ' + self.path)
+        return LazyArray(self.path, name, self.manifest['arrays'][name])
+
+
+def save_results(path, arrays, axes=None, attrs=None):
+    #Save a dictionary of arrays in one go. axes maps an array name to the list of axis
+    #array names it is defined on, e.g. {'phi_tot': ['Temper', 'freq']}.
+    if axes is None:
+        axes = {}
+    writer = ResultWriter(path, attrs)
+    for name in arrays:
+        writer.write(name, arrays[name], axes=axes.get(name))
+    writer.close()
+    return path
+
+def open_results(path):
+    return ResultReader(path)